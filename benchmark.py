@@ -0,0 +1,341 @@
+"""
+识别和输入热点路径的性能测试
+
+用法:
+python benchmark.py                          # 合成画面
+python benchmark.py --session sess_dir       # 使用 SessionRecorder 录制的画面
+python benchmark.py --output result.json     # 指定结果文件, 便于不同提交之间对比
+
+每个阶段输出 p50/p95/p99 延迟 (毫秒) 和每秒次数, 结果保存为 JSON
+停止延迟 (stop_*) 有任何一次超过 STOP_LATENCY_LIMIT 时返回码为 1
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+import cv2
+import numpy as np
+import mumucontroller
+import piccheck
+from capture import ReplayCapture
+from mannager import Manager, TemplateStore, TaskCancelled
+from recorder import SessionReplayCapture, ReplayFinished, ReplayController, VirtualClock
+
+FRAME_SIZE = (1600, 900)
+TEMPLATE_SIZES = [(60, 80), (80, 40), (60, 20), (120, 48)]
+LOAD_COUNTS = [10, 100, 1000]
+BATCH_COUNTS = [200, 400]   # picmath_many 大批量测试的模板数
+STOP_LATENCY_LIMIT = 0.5    # 停止请求到任务线程退出的最大允许延迟 (秒)
+
+
+def measure(func, iterations, warmup=3):
+    """
+    重复运行 func, 返回延迟分位数和吞吐量
+    """
+    for _ in range(warmup):
+        func()
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples[i] = time.perf_counter() - start
+    return latency_stats(samples)
+
+
+def latency_stats(samples):
+    iterations = len(samples)
+    return {
+        'iterations': iterations,
+        'mean_ms': float(samples.mean() * 1000),
+        'p50_ms': float(np.percentile(samples, 50) * 1000),
+        'p95_ms': float(np.percentile(samples, 95) * 1000),
+        'p99_ms': float(np.percentile(samples, 99) * 1000),
+        'ops_per_sec': float(iterations / samples.sum()) if samples.sum() > 0 else float('inf'),
+    }
+
+
+def synthetic_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = FRAME_SIZE
+    noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (5, 5), 0)
+
+
+def write_templates(frame, path, count, seed=1):
+    """
+    从画面中随机裁剪 count 个模板, 按 name_x1_y1_x2_y2.png 保存
+    """
+    rng = np.random.default_rng(seed)
+    height, width = frame.shape[:2]
+    os.makedirs(path, exist_ok=True)
+    for i in range(count):
+        w, h = TEMPLATE_SIZES[i % len(TEMPLATE_SIZES)]
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - h))
+        bgr = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_RGB2BGR)
+        cv2.imwrite(os.path.join(path, f"t{i}_{x}_{y}_{x + w}_{y + h}.png"), bgr)
+
+
+@contextmanager
+def bench_workspace(frame, template_count):
+    """
+    在临时目录中准备 Manager 需要的 pictures/ 和 key_xy.txt
+    """
+    workdir = tempfile.mkdtemp(prefix='hugan_bench_')
+    cwd = os.getcwd()
+    try:
+        write_templates(frame, os.path.join(workdir, 'pictures'), template_count)
+        os.makedirs(os.path.join(workdir, 'frames'))
+        cv2.imwrite(os.path.join(workdir, 'frames', 'frame.png'), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        with open(os.path.join(workdir, 'key_xy.txt'), 'w') as f:
+            f.write("X:(100, 100)\n")
+        os.chdir(workdir)
+        yield workdir
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class LoopingSessionCapture(SessionReplayCapture):
+    """
+    录制的画面用完后从头回放, 便于重复测量
+    """
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        try:
+            return super().grab(x_top, y_top, x_bottom, y_bottom)
+        except ReplayFinished:
+            self.position = 0
+            self.virtual.t = 0.0
+            return super().grab(x_top, y_top, x_bottom, y_bottom)
+
+
+def bench_recognition(manager, iterations):
+    results = {}
+    names = sorted(manager.original_pic_data)[:12]
+    name = names[0]
+    template, roi = manager.original_pic_data[name]
+    features = manager.get_pic_features(name)
+    x1, y1, x2, y2 = roi
+    client = manager.grab_client()
+    patch = np.ascontiguousarray(client[y1:y2, x1:x2])
+    gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200).astype(np.float64)
+
+    results['grab_roi'] = measure(lambda: manager.capture.grab(x1, y1, x2, y2), iterations)
+    results['grab_client'] = measure(manager.capture.grab_client, iterations)
+    results['cvtColor'] = measure(lambda: cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY), iterations)
+    results['canny'] = measure(lambda: cv2.Canny(gray, 100, 200), iterations)
+    results['ssim'] = measure(lambda: piccheck._ssim_score(features, edges), iterations)
+    results['compare_images'] = measure(lambda: piccheck.compare_images(template, patch), iterations)
+    results['compare_images_prepared'] = measure(lambda: piccheck.compare_images_prepared(features, patch), iterations)
+
+    manager.roi_cache_enabled = False
+    results['picmath'] = measure(lambda: manager.picmath(name), iterations)
+    results['picmath_cascade'] = measure(lambda: manager.picmath(name, cascade=True), iterations)
+    results[f'picmath_many_{len(names)}'] = measure(lambda: manager.picmath_many(names), iterations)
+    manager.set_recognition_threads(os.cpu_count() or 1)
+    if manager.recognition_pool is not None:
+        results[f'picmath_many_{len(names)}_parallel'] = measure(lambda: manager.picmath_many(names), iterations)
+    manager.set_recognition_threads(0)
+    manager.roi_cache_enabled = True
+    manager.reset_roi_cache()
+    results['picmath_roi_cached'] = measure(lambda: manager.picmath(name), iterations)
+    results['find'] = measure(lambda: manager.find(name), max(iterations // 10, 5))
+    return results
+
+
+def bench_batch(frame, counts, iterations):
+    """
+    大批量识别: picmath_many 一次计算全部模板, 与同一张快照上逐个 picscore 对比
+    """
+    results = {}
+    for count in counts:
+        with bench_workspace(frame, count):
+            manager = Manager(capture=ReplayCapture('frames'))
+            manager.roi_cache_enabled = False
+            names = sorted(manager.original_pic_data)
+
+            def each():
+                with manager.snapshot():
+                    for name in names:
+                        manager.picscore(name)
+            results[f'picmath_many_{count}'] = measure(lambda: manager.picmath_many(names), iterations)
+            results[f'picscore_each_{count}'] = measure(each, iterations)
+    return results
+
+
+def bench_loading(frame, counts):
+    results = {}
+    for count in counts:
+        with bench_workspace(frame, count):
+            def load(use_pack):
+                TemplateStore().load('pictures', use_pack)
+            iterations = 5 if count < 1000 else 3
+            results[f'loadpicinfo_png_{count}'] = measure(lambda: load(False), iterations, warmup=1)
+            results[f'loadpicinfo_pack_{count}'] = measure(lambda: load(True), iterations, warmup=1)
+    return results
+
+
+def fake_win32():
+    """
+    替换 mumucontroller 使用的 win32 接口, 只测 Python 侧的开销
+    """
+    posted = []
+    win32gui = SimpleNamespace(PostMessage=lambda *args: posted.append(args))
+    win32api = SimpleNamespace(MAKELONG=lambda low, high: (high << 16) | (low & 0xFFFF))
+    win32con = SimpleNamespace(
+        WM_LBUTTONDOWN=0x201, WM_LBUTTONUP=0x202, WM_RBUTTONDOWN=0x204, WM_RBUTTONUP=0x205,
+        MK_LBUTTON=0x1, MK_RBUTTON=0x2, WM_KEYDOWN=0x100, WM_KEYUP=0x101, WM_MOUSEMOVE=0x200,
+    )
+    return win32gui, win32api, win32con
+
+
+def bench_input(iterations):
+    saved = (mumucontroller.win32gui, mumucontroller.win32api, mumucontroller.win32con)
+    mumucontroller.win32gui, mumucontroller.win32api, mumucontroller.win32con = fake_win32()
+    try:
+        controller = mumucontroller.MuMuController()
+        controller.game_hwnd = 1
+        controller.client_rect = (0, 0) + FRAME_SIZE
+        # 使用虚拟时钟: 按下/抬起之间和手势各步之间的等待只推进虚拟时间,
+        # 只测手势计划, 消息构造和发送的开销
+        clock = VirtualClock()
+        controller.clock = clock.now
+        controller.sleep = clock.sleep
+        return {
+            'click': measure(lambda: controller.click(100, 200), iterations),
+            'press_key': measure(lambda: controller.press_key(0x41), iterations),
+            'swipe': measure(lambda: controller.swipe(100, 100, 600, 600, 0.8), iterations),
+        }
+    finally:
+        mumucontroller.win32gui, mumucontroller.win32api, mumucontroller.win32con = saved
+
+
+def stop_long_wait(manager):
+    manager.wait(30)
+
+
+def stop_polling(manager):
+    manager.wait_any(['t0', 't1'], threshold=2.0, max_interval=1.0)
+
+
+def stop_inputs(manager):
+    while True:
+        manager.press('X')
+        manager.picmath('t0')
+
+
+# 停止延迟的测试场景: 任务分别处于长等待, 轮询识别和连续输入
+STOP_TASKS = {'stop_wait': stop_long_wait, 'stop_polling': stop_polling, 'stop_input': stop_inputs}
+
+
+def stop_latency(manager, task, delay):
+    """
+    在线程中运行 task, delay 秒后设置 stop_event, 返回到任务线程退出的秒数
+    """
+    manager.stop_event = threading.Event()
+
+    def run():
+        try:
+            task(manager)
+        except TaskCancelled:
+            pass
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(delay)
+    start = time.perf_counter()
+    manager.stop_event.set()
+    thread.join()
+    return time.perf_counter() - start
+
+
+def bench_stop(iterations):
+    """
+    停止延迟: 测量设置 stop_event 到任务线程退出的时间 (见 STOP_TASKS),
+    超过 STOP_LATENCY_LIMIT 的次数记为 over_limit; 需要在 bench_workspace 中运行
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for name, task in STOP_TASKS.items():
+        manager = Manager(capture=ReplayCapture('frames'), controller=ReplayController())
+        samples = np.array([stop_latency(manager, task, float(rng.uniform(0.02, 0.1)))
+                            for _ in range(iterations)])
+        results[name] = latency_stats(samples)
+        results[name]['over_limit'] = int((samples > STOP_LATENCY_LIMIT).sum())
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def print_results(results):
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}")
+    for group in ('recognition', 'loading', 'input', 'stop'):
+        for stage, r in results[group].items():
+            print(f"{stage:<28}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['ops_per_sec']:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='识别和输入热点路径的性能测试')
+    parser.add_argument('--iterations', type=int, default=200, help='每个阶段的测量次数')
+    parser.add_argument('--session', help='SessionRecorder 录制的目录, 不指定时使用合成画面')
+    parser.add_argument('--pictures', default='pictures', help='使用录制画面时的模板目录')
+    parser.add_argument('--output', help='结果JSON路径, 默认 bench_results/<时间>_<提交>.json')
+    args = parser.parse_args()
+
+    frame = synthetic_frame()
+    if args.session:
+        pictures = os.path.abspath(args.pictures)
+        session = os.path.abspath(args.session)
+        with bench_workspace(frame, 0):
+            shutil.rmtree('pictures')
+            shutil.copytree(pictures, 'pictures')
+            recognition = bench_recognition(Manager(capture=LoopingSessionCapture(session)), args.iterations)
+    else:
+        with bench_workspace(frame, 12):
+            recognition = bench_recognition(Manager(capture=ReplayCapture('frames')), args.iterations)
+    recognition.update(bench_batch(frame, BATCH_COUNTS, max(args.iterations // 10, 5)))
+    with bench_workspace(frame, 2):
+        stop = bench_stop(max(args.iterations // 10, 5))
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'source': args.session or 'synthetic',
+        'recognition': recognition,
+        'loading': bench_loading(frame, LOAD_COUNTS),
+        'input': bench_input(args.iterations),
+        'stop': stop,
+    }
+    print_results(results)
+
+    output = args.output or os.path.join('bench_results', f"{time.strftime('%Y%m%d_%H%M%S')}_{commit or 'nogit'}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"结果已保存到 {output}")
+    over = {stage: r['over_limit'] for stage, r in stop.items() if r['over_limit']}
+    if over:
+        print(f"停止延迟超过 {STOP_LATENCY_LIMIT * 1000:.0f} ms: {over}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import ctypes
+import os
+import cv2
+import numpy as np
+from PIL import ImageGrab
+
+
+class CaptureBackend:
+    """
+    截图后端基类, 坐标均为游戏客户区坐标, 返回RGB数组
+    """
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        raise NotImplementedError
+
+    def client_size(self):
+        raise NotImplementedError
+
+    def grab_client(self):
+        width, height = self.client_size()
+        return self.grab(0, 0, width, height)
+
+
+class ImageGrabCapture(CaptureBackend):
+    """
+    用 PIL.ImageGrab 截取桌面上游戏窗口所在的区域 (窗口被遮挡时会截到遮挡物)
+    """
+    def __init__(self, controller):
+        self.controller = controller
+
+    def client_size(self):
+        return self.controller.client_rect[2], self.controller.client_rect[3]
+
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        region = (
+            self.controller.window_left + x_top,
+            self.controller.window_top + y_top,
+            self.controller.window_left + x_bottom,
+            self.controller.window_top + y_bottom,
+        )
+        return np.array(ImageGrab.grab(bbox=region).convert('RGB'))
+
+
+class WindowCapture(CaptureBackend):
+    """
+    通过窗口句柄截图, 窗口被遮挡时也能截到游戏画面
+
+    method:
+    'bitblt': 从窗口DC复制指定区域, 速度快
+    'printwindow': 让窗口重绘到内存DC, 适用于 BitBlt 得到黑屏的硬件加速窗口
+    """
+    PW_CLIENTONLY = 0x1
+    PW_RENDERFULLCONTENT = 0x2
+
+    def __init__(self, controller, method='bitblt'):
+        import win32con
+        import win32gui
+        import win32ui
+        self.win32con = win32con
+        self.win32gui = win32gui
+        self.win32ui = win32ui
+        self.controller = controller
+        self.method = method
+
+    def client_size(self):
+        return self.controller.client_rect[2], self.controller.client_rect[3]
+
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        if self.method == 'printwindow':
+            # PrintWindow 只能整窗口重绘, 截完再裁剪
+            width, height = self.client_size()
+            frame = self._capture(0, 0, width, height)
+            return np.ascontiguousarray(frame[y_top:y_bottom, x_top:x_bottom])
+        return self._capture(x_top, y_top, x_bottom - x_top, y_bottom - y_top)
+
+    def _capture(self, x, y, width, height):
+        hwnd = self.controller.game_hwnd
+        hwnd_dc = self.win32gui.GetDC(hwnd)
+        mfc_dc = self.win32ui.CreateDCFromHandle(hwnd_dc)
+        save_dc = mfc_dc.CreateCompatibleDC()
+        bitmap = self.win32ui.CreateBitmap()
+        try:
+            bitmap.CreateCompatibleBitmap(mfc_dc, width, height)
+            save_dc.SelectObject(bitmap)
+            if self.method == 'printwindow':
+                ctypes.windll.user32.PrintWindow(hwnd, save_dc.GetSafeHdc(),
+                                                 self.PW_CLIENTONLY | self.PW_RENDERFULLCONTENT)
+            else:
+                save_dc.BitBlt((0, 0), (width, height), mfc_dc, (x, y), self.win32con.SRCCOPY)
+            bits = bitmap.GetBitmapBits(True)
+        finally:
+            self.win32gui.DeleteObject(bitmap.GetHandle())
+            save_dc.DeleteDC()
+            mfc_dc.DeleteDC()
+            self.win32gui.ReleaseDC(hwnd, hwnd_dc)
+
+        # BGRA -> RGB
+        bgra = np.frombuffer(bits, dtype=np.uint8).reshape(height, width, 4)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB)
+
+
+class ReplayCapture(CaptureBackend):
+    """
+    回放录制好的画面 (图片目录或视频文件), 不需要模拟器即可运行识别代码
+    每次截图前进一帧, 播放完后 loop=True 时从头开始, 否则停在最后一帧
+    """
+    IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, loop=True):
+        self.path = path
+        self.loop = loop
+        self.frame = None
+        self.frame_index = -1
+        self.peeked = False             # client_size 已提前读入下一帧
+        self.video = None
+        self.files = []
+        if os.path.isdir(path):
+            self.files = sorted(
+                os.path.join(path, file) for file in os.listdir(path)
+                if file.lower().endswith(self.IMAGE_EXTS)
+            )
+            if not self.files:
+                raise ValueError(f"目录中没有图片: {path}")
+        else:
+            self.video = cv2.VideoCapture(path)
+            if not self.video.isOpened():
+                raise ValueError(f"无法打开视频: {path}")
+
+    def next_frame(self):
+        """
+        读取下一帧
+        """
+        if self.video is not None:
+            ok, bgr = self.video.read()
+            if not ok and self.loop:
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, bgr = self.video.read()
+            if ok:
+                self.frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+                self.frame_index += 1
+        else:
+            index = self.frame_index + 1
+            if index >= len(self.files):
+                index = 0 if self.loop else len(self.files) - 1
+            if index != self.frame_index or self.frame is None:
+                bgr = cv2.imread(self.files[index], cv2.IMREAD_COLOR)
+                self.frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            self.frame_index = index
+        return self.frame
+
+    def client_size(self):
+        if self.frame is None:
+            self.next_frame()
+            self.peeked = True
+        return self.frame.shape[1], self.frame.shape[0]
+
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        if self.peeked:
+            self.peeked = False
+            frame = self.frame
+        else:
+            frame = self.next_frame()
+        return np.ascontiguousarray(frame[y_top:y_bottom, x_top:x_bottom])
+
+
+def make_capture(capture, controller):
+    """
+    根据名称创建截图后端, 已经是后端对象时直接返回
+
+    capture: 'imagegrab' | 'window' | 'printwindow' | 回放目录或视频路径 | CaptureBackend
+    """
+    if isinstance(capture, CaptureBackend):
+        return capture
+    if capture is None or capture == 'imagegrab':
+        return ImageGrabCapture(controller)
+    if capture == 'window':
+        return WindowCapture(controller, 'bitblt')
+    if capture == 'printwindow':
+        return WindowCapture(controller, 'printwindow')
+    if os.path.exists(capture):
+        return ReplayCapture(capture)
+    raise ValueError(f"未知的截图方式: {capture}")
@@ -3,20 +3,25 @@ import os
 from datetime import datetime
 from PySide6.QtWidgets import (QApplication, QPushButton, 
                                QVBoxLayout, QWidget, QLabel, QMessageBox,
-                               QHBoxLayout, QLineEdit)
-from PySide6.QtGui import QPixmap, QPainter, QPen, QScreen, QGuiApplication, QColor, QFont
+                               QHBoxLayout, QLineEdit, QCheckBox)
+from PySide6.QtGui import QPixmap, QPainter, QPen, QScreen, QGuiApplication, QColor, QFont, QRegion
 from PySide6.QtCore import Qt, QRect, QPoint, QTimer, Signal
 
 class ScreenshotSelector(QWidget):
     finished = Signal(QPixmap, QRect)
+    INFO_RECT = QRect(10, 10, 500, 65)  # 坐标和尺寸信息的显示区域
     
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, capture_rect=None):
+        """
+        capture_rect: 只截取的屏幕区域 (例如游戏窗口), None 表示整个屏幕
+        """
         super().__init__(parent, Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
         self.setAttribute(Qt.WA_TranslucentBackground)
         
         # 获取屏幕尺寸
         screen_geometry = QGuiApplication.primaryScreen().geometry()
-        self.setGeometry(screen_geometry)
+        self.capture_rect = capture_rect.intersected(screen_geometry) if capture_rect else screen_geometry
+        self.setGeometry(self.capture_rect)
         
         self.start_point = QPoint()
         self.end_point = QPoint()
@@ -25,27 +30,45 @@ class ScreenshotSelector(QWidget):
         self.selection_rect = QRect()
         
         # 捕获当前屏幕
-        self.full_screenshot = QGuiApplication.primaryScreen().grabWindow(0)
+        self.full_screenshot = QGuiApplication.primaryScreen().grabWindow(
+            0, self.capture_rect.x(), self.capture_rect.y(), self.capture_rect.width(), self.capture_rect.height())
+        self.pixel_ratio = self.full_screenshot.devicePixelRatio()
+
+        # 预先画好变暗的背景, 重绘时只需要复制像素
+        self.dimmed_screenshot = QPixmap(self.full_screenshot)
+        painter = QPainter(self.dimmed_screenshot)
+        painter.fillRect(self.dimmed_screenshot.rect(), QColor(0, 0, 0, 100))
+        painter.end()
         
         # 设置光标样式
         self.setCursor(Qt.CrossCursor)
+
+    def _source_rect(self, rect):
+        """
+        窗口坐标转换为截图中的像素坐标 (高DPI屏幕上截图像素比窗口坐标多)
+        """
+        ratio = self.pixel_ratio
+        return QRect(round(rect.x() * ratio), round(rect.y() * ratio),
+                     round(rect.width() * ratio), round(rect.height() * ratio))
+
+    def _dirty_rect(self, rect):
+        # 包含选择边框的线宽
+        return rect.adjusted(-2, -2, 2, 2)
         
     def paintEvent(self, event):
         painter = QPainter(self)
         
-        # 绘制当前屏幕
-        painter.drawPixmap(0, 0, self.full_screenshot)
-        
-        # 绘制半透明覆盖层
-        painter.fillRect(self.rect(), QColor(0, 0, 0, 100))
+        # 只重绘需要更新的矩形 (event.rect() 是它们的外接矩形, 可能接近整个屏幕):
+        # 变暗的背景来自缓存, 与选区相交的部分换成清晰内容
+        rect = self.selection_rect
+        for dirty in event.region():
+            painter.drawPixmap(dirty, self.dimmed_screenshot, self._source_rect(dirty))
+            if self.is_selecting:
+                clear = dirty.intersected(rect)
+                if not clear.isEmpty():
+                    painter.drawPixmap(clear, self.full_screenshot, self._source_rect(clear))
         
         if self.is_selecting:
-            # 绘制选择区域
-            rect = QRect(self.start_point, self.end_point).normalized()
-            self.selection_rect = rect
-            
-            # 绘制选择区域内的清晰内容
-            painter.drawPixmap(rect, self.full_screenshot, rect)
             
             # 绘制选择边框
             painter.setPen(QPen(Qt.red, 2))
@@ -57,7 +80,8 @@ class ScreenshotSelector(QWidget):
             font.setPointSize(12)
             painter.setFont(font)
             
-            info_text = f"左上角: ({rect.x()}, {rect.y()}) 右下角: ({rect.x() + rect.width()}, {rect.y() + rect.height()})"
+            left, top = rect.x() + self.capture_rect.x(), rect.y() + self.capture_rect.y()
+            info_text = f"左上角: ({left}, {top}) 右下角: ({left + rect.width()}, {top + rect.height()})"
             size_text = f"尺寸: {rect.width()} x {rect.height()}"
             
             # 在合适的位置显示信息
@@ -75,12 +99,20 @@ class ScreenshotSelector(QWidget):
             self.start_point = event.position().toPoint()
             self.end_point = event.position().toPoint()
             self.is_selecting = True
+            self.selection_rect = QRect(self.start_point, self.end_point).normalized()
+            self.update(QRegion(self._dirty_rect(self.selection_rect)) + QRegion(self.INFO_RECT))
             
     def mouseMoveEvent(self, event):
         if self.is_selecting:
             # 使用 position() 而不是弃用的 pos()
             self.end_point = event.position().toPoint()
-            self.update()
+            # 只重绘旧选区, 新选区和信息文字所在的区域
+            old_rect = self.selection_rect
+            self.selection_rect = QRect(self.start_point, self.end_point).normalized()
+            dirty = QRegion(self._dirty_rect(old_rect))
+            dirty += QRegion(self._dirty_rect(self.selection_rect))
+            dirty += QRegion(self.INFO_RECT)
+            self.update(dirty)
             
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton and self.is_selecting:
@@ -93,14 +125,13 @@ class ScreenshotSelector(QWidget):
             
             # 确保区域有效
             if rect.width() > 5 and rect.height() > 5:
-                # 截取屏幕
-                screen = QGuiApplication.primaryScreen()
-                self.screenshot = screen.grabWindow(0, rect.x(), rect.y(), rect.width(), rect.height())
+                # 从打开选择器时的截图中裁剪, 不需要再截一次屏幕
+                self.screenshot = self.full_screenshot.copy(self._source_rect(rect))
                 
-            # 发送完成信号和区域信息
+            # 发送完成信号和区域信息 (屏幕坐标)
             self.finished.emit(
                 self.screenshot if self.screenshot and not self.screenshot.isNull() else QPixmap(),
-                rect
+                rect.translated(self.capture_rect.topLeft())
             )
             self.close()
             
@@ -111,10 +142,18 @@ class ScreenshotSelector(QWidget):
             self.close()
 
 class ScreenshotWindow(QWidget):
-    def __init__(self, fixed_x=0, fixed_y=0):
+    def __init__(self, fixed_x=0, fixed_y=0, window_size=None, client_origin=None):
+        """
+        fixed_x, fixed_y: 游戏窗口左上角的屏幕坐标, 保存时换算成客户区坐标
+        window_size: 游戏客户区的 (宽, 高), 指定时可以选择只截取游戏窗口
+        client_origin: 客户区左上角的屏幕坐标 (ClientToScreen), 省略时使用 fixed_x, fixed_y
+        以上坐标都是 Win32 的物理像素, Qt 使用逻辑像素, 高DPI屏幕上需要除以 devicePixelRatio
+        """
         super().__init__()
         self.fixed_x = fixed_x
         self.fixed_y = fixed_y
+        self.window_size = window_size
+        self.client_origin = client_origin or (fixed_x, fixed_y)
         self.setWindowTitle("截图工具")
         self.setGeometry(100, 100, 500, 400)
         
@@ -128,6 +167,12 @@ class ScreenshotWindow(QWidget):
         self.screenshot_btn.clicked.connect(self.start_screenshot)
         button_layout.addWidget(self.screenshot_btn)
 
+        # 只截取游戏窗口: 高分辨率屏幕上选择器需要处理的像素更少
+        self.window_only_check = QCheckBox("只截取游戏窗口")
+        self.window_only_check.setEnabled(bool(window_size and all(window_size)))
+        self.window_only_check.setChecked(self.window_only_check.isEnabled())
+        button_layout.addWidget(self.window_only_check)
+
 
         self.save_btn = QPushButton("保存截图")
         self.save_btn.clicked.connect(self.save_screenshot)
@@ -171,7 +216,13 @@ class ScreenshotWindow(QWidget):
     def show_screenshot_selector(self):
         try:
             # 创建截图选择器
-            self.selector = ScreenshotSelector()
+            capture_rect = None
+            if self.window_only_check.isChecked():
+                # 物理像素换算成 Qt 的逻辑像素
+                ratio = QGuiApplication.primaryScreen().devicePixelRatio()
+                (x, y), (width, height) = self.client_origin, self.window_size
+                capture_rect = QRect(round(x / ratio), round(y / ratio), round(width / ratio), round(height / ratio))
+            self.selector = ScreenshotSelector(capture_rect=capture_rect)
             self.selector.finished.connect(self.on_screenshot_finished)
             self.selector.show()
         except Exception as e:
@@ -218,6 +269,10 @@ class ScreenshotWindow(QWidget):
             # 获取坐标信息
             top_x, top_y = self.current_rect.x(), self.current_rect.y()
             bottom_x, bottom_y = self.current_rect.x() + self.current_rect.width(), self.current_rect.y() + self.current_rect.height()
+            # 选择器给出的是逻辑像素, 换算成与 fixed_x, fixed_y 相同的物理像素
+            ratio = QGuiApplication.primaryScreen().devicePixelRatio()
+            top_x, top_y = round(top_x * ratio), round(top_y * ratio)
+            bottom_x, bottom_y = round(bottom_x * ratio), round(bottom_y * ratio)
             
             top_x -= self.fixed_x
             top_y -= self.fixed_y
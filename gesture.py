@@ -0,0 +1,173 @@
+import math
+import time
+
+SPIN = 0.002    # 截止时间前最后这段时间忙等, 避免 sleep 唤醒误差
+
+
+def sleep_until(deadline, clock=time.monotonic, sleep=time.sleep):
+    """
+    等待到 deadline (clock 的时间), 先 sleep 再短暂忙等
+    clock 和 sleep 需要配套, 例如回放用的虚拟时钟 (recorder.VirtualClock 的 now 和 sleep)
+    """
+    remaining = deadline - clock()
+    if sleep is not time.sleep:
+        # 不是真实时间: sleep 本身推进时钟, 忙等不会让时钟前进
+        if remaining > 0:
+            sleep(remaining)
+        return
+    if remaining > SPIN:
+        time.sleep(remaining - SPIN)
+    while clock() < deadline:
+        time.sleep(0)
+
+
+class Gesture:
+    """
+    手势: 按下, 沿路径移动, 停留, 抬起组成的时间线, 时间为相对手势开始的秒数
+
+    g = Gesture().press(100, 100).move_to(300, 300, 0.2).hold(0.5).release()
+    g = Gesture().press(*start).bezier((400, 100), (500, 400), end, duration=0.4).release()
+
+    rate: 移动过程中每秒发送的鼠标移动消息数
+    """
+    def __init__(self, rate=60, button="left"):
+        self.rate = rate
+        self.button = button
+        self.events = []        # (t, 'down'|'move'|'up', x, y)
+        self.t = 0.0
+        self.pos = None
+        self.pressed = False
+
+    def _require_pressed(self):
+        if not self.pressed:
+            raise ValueError("手势需要先 press")
+
+    def press(self, x, y):
+        self.pos = (x, y)
+        self.pressed = True
+        self.events.append((self.t, 'down', x, y))
+        return self
+
+    def _sweep(self, func, duration):
+        """
+        按 rate 采样 func(u), u 从 0 到 1, 用时 duration
+        """
+        n = max(1, math.ceil(duration * self.rate))
+        for i in range(1, n + 1):
+            u = i / n
+            x, y = func(u)
+            self.events.append((self.t + duration * u, 'move', x, y))
+        self.t += duration
+        self.pos = func(1.0)
+
+    def move_to(self, x, y, duration=0.0):
+        self._require_pressed()
+        x0, y0 = self.pos
+        self._sweep(lambda u: (x0 + (x - x0) * u, y0 + (y - y0) * u), duration)
+        return self
+
+    def path(self, points, duration):
+        """
+        沿折线依次经过 points, 各段用时与长度成正比
+        """
+        self._require_pressed()
+        points = [self.pos] + list(points)
+        lengths = [math.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(points, points[1:])]
+        total = sum(lengths)
+        for (x, y), length in zip(points[1:], lengths):
+            self.move_to(x, y, duration * length / total if total else duration / len(lengths))
+        return self
+
+    def bezier(self, *points, duration=0.5):
+        """
+        从当前位置出发的贝塞尔曲线, points 为控制点和终点
+        """
+        self._require_pressed()
+        control = [self.pos] + list(points)
+
+        def curve(u):
+            pts = control
+            while len(pts) > 1:
+                pts = [(x0 + (x1 - x0) * u, y0 + (y1 - y0) * u) for (x0, y0), (x1, y1) in zip(pts, pts[1:])]
+            return pts[0]
+        self._sweep(curve, duration)
+        return self
+
+    def hold(self, seconds):
+        self.t += seconds
+        return self
+
+    def release(self):
+        self._require_pressed()
+        self.events.append((self.t, 'up') + tuple(self.pos))
+        self.pressed = False
+        return self
+
+    def plan(self, adjust=None):
+        """
+        生成发送计划, 合并坐标没有变化的移动消息
+
+        参数:
+        adjust: 把坐标换算成实际发送坐标的函数 (例如 DPI 缩放), 用于判断是否重复
+
+        返回:
+        ([(t, kind, x, y), ...], 被合并掉的移动消息数)
+        """
+        adjust = adjust or (lambda x, y: (int(x), int(y)))
+        events = list(self.events)
+        if self.pressed:
+            events.append((self.t, 'up') + tuple(self.pos))
+        planned = []
+        coalesced = 0
+        last = None
+        for t, kind, x, y in events:
+            key = adjust(x, y)
+            if kind == 'move' and key == last:
+                coalesced += 1
+                continue
+            planned.append((t, kind, x, y))
+            last = key
+        return planned, coalesced
+
+    def steps(self, controller):
+        """
+        转换为 InputQueue 使用的基本操作列表, 返回 ([(t, 函数, 参数)], 被合并的移动数)
+        """
+        planned, coalesced = self.plan(getattr(controller, '_adjust_coords', None))
+        funcs = {
+            'down': lambda x, y: (controller.mouse_down, (x, y, self.button, False)),
+            'move': lambda x, y: (controller.mouse_move, (x, y, self.button)),
+            'up': lambda x, y: (controller.mouse_up, (x, y, self.button, False)),
+        }
+        return [(t,) + funcs[kind](x, y) for t, kind, x, y in planned], coalesced
+
+
+def play(controller, gesture, clock=time.monotonic, sleep=time.sleep):
+    """
+    按单调时钟的截止时间依次发送手势, 阻塞到手势结束
+    clock, sleep: 计时和等待函数, 见 sleep_until
+
+    返回:
+    执行报告: 计划用时, 实际用时, 发送/合并的消息数, 平均和最大延迟 (秒)
+    """
+    steps, coalesced = gesture.steps(controller)
+    start = clock()
+    late_total = 0.0
+    late_max = 0.0
+    ok = True
+    for t, func, args in steps:
+        deadline = start + t
+        sleep_until(deadline, clock, sleep)
+        late = clock() - deadline
+        late_total += late
+        late_max = max(late_max, late)
+        ok = func(*args) is not False and ok
+    return {
+        'ok': ok,
+        'intended': steps[-1][0] if steps else 0.0,
+        'actual': clock() - start,
+        'posted': len(steps),
+        'coalesced': coalesced,
+        'late_mean': late_total / len(steps) if steps else 0.0,
+        'late_max': late_max,
+    }
@@ -0,0 +1,81 @@
+"""
+网格扫描: 在一张截图上一次性给等距网格 (例如城墙格子) 的每个格子打分,
+只点击得分高的候选格子, 代替逐格点击后再识别
+"""
+import cv2
+import numpy as np
+
+
+class Lattice:
+    """
+    斜向网格: 第 (i, j) 个格子的中心为 origin + i * step_i + j * step_j
+    """
+    def __init__(self, origin, step_i, step_j, shape):
+        self.origin = origin        # (x, y)
+        self.step_i = step_i        # (dx, dy)
+        self.step_j = step_j
+        self.shape = shape          # (i 的个数, j 的个数)
+
+    def indices(self):
+        """
+        所有格子的 (i, j), 形状为 (N, 2), 顺序与 points 一致
+        """
+        i, j = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing='ij')
+        return np.stack([i.ravel(), j.ravel()], axis=1)
+
+    def points(self, scale=(1.0, 1.0)):
+        """
+        所有格子中心的客户区坐标, 形状为 (N, 2); scale 为相对网格定义时分辨率的缩放比例
+        """
+        ij = self.indices()
+        x = self.origin[0] + ij[:, 0] * self.step_i[0] + ij[:, 1] * self.step_j[0]
+        y = self.origin[1] + ij[:, 0] * self.step_i[1] + ij[:, 1] * self.step_j[1]
+        return np.stack([np.rint(x * scale[0]), np.rint(y * scale[1])], axis=1).astype(np.int64)
+
+
+# mannager.py 中 update_wall 使用的城墙网格: (798 + 12i - 12j, 143 + 10i + 10j), i, j 取 0-14
+WALL_LATTICE = Lattice((798, 143), (12, 10), (-12, 10), (15, 15))
+
+
+def scan_region(points, margin, client_size):
+    """
+    覆盖所有格子 (向外扩展 margin 像素) 并限制在客户区内的截图区域 [x1, y1, x2, y2]
+    """
+    width, height = client_size
+    return [max(int(points[:, 0].min()) - margin, 0), max(int(points[:, 1].min()) - margin, 0),
+            min(int(points[:, 0].max()) + margin + 1, width), min(int(points[:, 1].max()) + margin + 1, height)]
+
+
+def scan_grid(gray, points, templates, jitter=2):
+    """
+    对每个格子计算与模板的最大相似度
+
+    参数:
+    gray: 截图区域的灰度图
+    points: 格子中心在 gray 中的坐标, (N, 2)
+    templates: [模板灰度图, ...], 模板中心对准格子中心
+    jitter: 允许格子中心偏移的像素数
+
+    返回:
+    (分数数组 (N,), 最佳模板序号数组 (N,)), 模板超出截图区域的格子分数为 -1
+    """
+    best = np.full(len(points), -1.0)
+    best_template = np.full(len(points), -1)
+    kernel = np.ones((2 * jitter + 1, 2 * jitter + 1), np.uint8) if jitter > 0 else None
+    for k, template in enumerate(templates):
+        th, tw = template.shape[:2]
+        if th > gray.shape[0] or tw > gray.shape[1]:
+            continue
+        # 每个模板在整个区域上只做一次匹配, 再按格子坐标取值
+        result = np.nan_to_num(cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED))
+        if kernel is not None:
+            result = cv2.dilate(result, kernel)
+        xs = points[:, 0] - tw // 2
+        ys = points[:, 1] - th // 2
+        valid = (xs >= 0) & (ys >= 0) & (xs < result.shape[1]) & (ys < result.shape[0])
+        scores = np.full(len(points), -1.0)
+        scores[valid] = result[ys[valid], xs[valid]]
+        better = scores > best
+        best[better] = scores[better]
+        best_template[better] = k
+    return best, best_template
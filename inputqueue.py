@@ -0,0 +1,180 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from gesture import Gesture, SPIN
+
+
+class InputQueue:
+    """
+    异步输入队列: 点击, 按键和滑动拆成带时间戳的基本操作 (按下/移动/抬起),
+    由后台线程按截止时间发送, 调用方立即拿到 Future, 可以在输入执行期间继续截图识别
+
+    同一队列中的操作按提交顺序依次执行, 前一个操作结束 (加上 gap) 后下一个才开始
+    Future 的结果为 True/False, 表示所有基本操作是否都发送成功
+    """
+    def __init__(self, controller, clock=time.monotonic):
+        self.controller = controller
+        self.clock = clock
+        self.heap = []              # (截止时间, 序号, 函数, 参数, 所属操作)
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.dispatch_lock = threading.Lock()   # 发送一个基本操作期间持有, cancel 用它与发送线程互斥
+        self.busy_until = 0.0       # 已排队操作的结束时间
+        self.pending = 0            # 尚未完成的操作数
+        self.running = True
+        self.stats = {'dispatched': 0, 'late_total': 0.0, 'late_max': 0.0}
+        self.thread = threading.Thread(target=self._run, name='InputQueue', daemon=True)
+        self.thread.start()
+
+    def _submit(self, steps, gap=0.0, delay=0.0):
+        """
+        提交一个由若干基本操作组成的输入
+
+        steps: [(相对开始时间的秒数, 函数, 参数元组), ...], 按时间排序
+        gap: 本操作结束后到下一个操作开始的间隔
+        delay: 最早在提交后多少秒开始
+        """
+        future = Future()
+        # held: 已发送按下但还没发送抬起的次数, cancel 时只为这些补发抬起
+        action = {'future': future, 'ok': True, 'remaining': len(steps), 'finished': False, 'held': 0}
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("输入队列已关闭")
+            start = max(self.clock() + delay, self.busy_until)
+            self.busy_until = start + steps[-1][0] + gap
+            for offset, func, args in steps:
+                heapq.heappush(self.heap, (start + offset, next(self.seq), func, args, action))
+            self.pending += 1
+            self.cond.notify_all()
+        return future
+
+    def click(self, x, y, button="left", gap=0.0, delay=0.0):
+        hold = random.uniform(0.05, 0.15)
+        return self._submit([
+            (0.0, self.controller.mouse_down, (x, y, button)),
+            (hold, self.controller.mouse_up, (x, y, button)),
+        ], gap, delay)
+
+    def press_key(self, vk_code, press_time=0.1, gap=0.0, delay=0.0):
+        return self._submit([
+            (0.0, self.controller.key_down, (vk_code,)),
+            (press_time, self.controller.key_up, (vk_code,)),
+        ], gap, delay)
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0.5, gap=0.0, delay=0.0):
+        gesture = Gesture().press(start_x, start_y).move_to(end_x, end_y, duration).release()
+        return self.gesture(gesture, gap, delay)
+
+    def gesture(self, gesture, gap=0.0, delay=0.0):
+        """
+        提交手势 (见 gesture.Gesture)
+        """
+        steps, coalesced = gesture.steps(self.controller)
+        return self._submit(steps, gap, delay)
+
+    def _is_down(self, func):
+        return func in (self.controller.mouse_down, self.controller.key_down)
+
+    def _is_up(self, func):
+        return func in (self.controller.mouse_up, self.controller.key_up)
+
+    def _call(self, func, args):
+        try:
+            return func(*args)
+        except Exception as e:
+            print(f"输入操作失败: {e}")
+            return False
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.heap:
+                    self.cond.wait()
+                if not self.heap:
+                    return
+                deadline = self.heap[0][0]
+                remaining = deadline - self.clock()
+                if remaining > SPIN:
+                    self.cond.wait(remaining - SPIN)
+                    continue
+
+            while self.clock() < deadline:
+                time.sleep(0)
+            with self.dispatch_lock:
+                with self.cond:
+                    # 忙等期间可能被 cancel 清空, 或提交了更早的操作
+                    if not self.heap or self.heap[0][0] > self.clock():
+                        continue
+                    deadline, _, func, args, action = heapq.heappop(self.heap)
+                late = self.clock() - deadline
+                ok = self._call(func, args)
+
+                with self.cond:
+                    self.stats['dispatched'] += 1
+                    self.stats['late_total'] += late
+                    self.stats['late_max'] = max(self.stats['late_max'], late)
+                    if self._is_down(func):
+                        action['held'] += 1
+                    elif self._is_up(func) and action['held'] > 0:
+                        action['held'] -= 1
+                    action['ok'] = action['ok'] and ok is not False
+                    action['remaining'] -= 1
+                    if action['remaining'] == 0:
+                        self._finish(action)
+
+    def _finish(self, action, cancelled=False):
+        # 调用时需持有 self.cond
+        if action['finished']:
+            return
+        action['finished'] = True
+        self.pending -= 1
+        if cancelled:
+            action['future'].cancel()
+        else:
+            action['future'].set_result(action['ok'])
+        self.cond.notify_all()
+
+    def join(self, timeout=None):
+        """
+        等待队列中的输入全部执行完, 超时返回 False
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.pending:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def cancel(self):
+        """
+        丢弃还没开始执行的基本操作, 已按下的键/鼠标会被补发抬起
+        """
+        # 持有 dispatch_lock 时发送线程不在发送中, 补发的抬起不会早于已取出的按下
+        with self.dispatch_lock:
+            with self.cond:
+                dropped = sorted(self.heap)
+                self.heap = []
+                self.busy_until = 0.0
+                self.cond.notify_all()
+            for _, _, func, args, action in dropped:
+                if self._is_up(func) and action['held'] > 0:
+                    action['held'] -= 1
+                    self._call(func, args)
+            with self.cond:
+                for _, _, _, _, action in dropped:
+                    self._finish(action, cancelled=True)
+
+    def close(self, wait=True):
+        if wait:
+            self.join()
+        else:
+            self.cancel()
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
@@ -0,0 +1,120 @@
+"""
+多开: 一个进程同时控制多个模拟器窗口
+
+所有实例共享同一份只读的 TemplateStore, 识别计算通过一个信号量限制并发数
+(默认等于CPU核数), OpenCV 计算时会释放 GIL, 各实例的识别可以分摊到多个核上
+"""
+import os
+import threading
+from mannager import Manager, TemplateStore, TaskCancelled
+
+
+class Instance:
+    """
+    一个模拟器实例及其运行状态
+    """
+    def __init__(self, name, manager):
+        self.name = name
+        self.manager = manager
+        self.status = '未连接'
+        self.iterations = 0
+        self.last_message = ''
+
+    def info(self):
+        return {'name': self.name, 'status': self.status, 'iterations': self.iterations,
+                'last_message': self.last_message}
+
+
+class InstancePool:
+    """
+    管理多个实例, 实例按添加顺序排列
+
+    pool = InstancePool()
+    pool.add("部落冲突 - MuMu安卓设备")
+    pool.add("部落冲突 - MuMu安卓设备-1")
+    pool.connect_all()
+    """
+    def __init__(self, templates=None, max_recognition=None):
+        if templates is None:
+            templates = TemplateStore()
+            templates.load("pictures")
+        self.templates = templates
+        self.recognition_slots = threading.BoundedSemaphore(max_recognition or os.cpu_count() or 1)
+        self.instances = {}
+
+    def add(self, name, capture='imagegrab', controller=None, manager=None):
+        """
+        添加实例, manager 不指定时新建一个共享模板的 Manager
+        """
+        if name in self.instances:
+            raise ValueError(f"实例 {name} 已存在")
+        if manager is None:
+            manager = Manager(capture=capture, controller=controller, templates=self.templates)
+        manager.recognition_slots = self.recognition_slots
+        instance = Instance(name, manager)
+        self.instances[name] = instance
+        return instance
+
+    def remove(self, name):
+        instance = self.instances.pop(name)
+        instance.manager.recognition_slots = None
+        return instance
+
+    def clear(self):
+        for name in list(self.instances):
+            self.remove(name)
+
+    def connect(self, name):
+        instance = self.instances[name]
+        ok = instance.manager.connect(name)
+        instance.status = '已连接' if ok else '连接失败'
+        return ok
+
+    def connect_all(self):
+        return {name: self.connect(name) for name in self.instances}
+
+    def connected(self):
+        return [instance for instance in self.instances.values() if instance.manager.has_connected]
+
+    def run_all(self, func, times=1, stop_event=None):
+        """
+        不依赖界面, 在每个已连接实例上各用一个线程运行 func(manager) times 次
+
+        返回:
+        {实例名: 异常}, 正常结束的实例对应 None
+        """
+        stop_event = stop_event or threading.Event()
+        errors = {}
+
+        def worker(instance):
+            instance.status = '运行中'
+            instance.manager.stop_event = stop_event
+            try:
+                for _ in range(times):
+                    if stop_event.is_set():
+                        break
+                    func(instance.manager)
+                    instance.iterations += 1
+                errors[instance.name] = None
+                instance.status = '已完成'
+            except TaskCancelled:
+                instance.manager.cancel_input()
+                errors[instance.name] = None
+                instance.status = '已停止'
+            except Exception as e:
+                errors[instance.name] = e
+                instance.last_message = f'Task error: {e}'
+                instance.status = '出错'
+            finally:
+                instance.manager.stop_event = None
+
+        threads = [threading.Thread(target=worker, args=(instance,), name=f'instance-{instance.name}')
+                   for instance in self.connected()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def status(self):
+        return [instance.info() for instance in self.instances.values()]
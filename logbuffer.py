@@ -0,0 +1,87 @@
+"""
+界面日志: 固定容量的环形缓冲区 + 按固定频率批量刷新到界面, 以及后台线程写入的滚动日志文件
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+
+class LogBuffer:
+    """
+    线程安全的日志环形缓冲区, 最多保留 capacity 条;
+    界面定时调用 drain 取出上次之后新增的消息, 积压超过 capacity 时丢弃最旧的并计数
+    """
+    def __init__(self, capacity=2000):
+        self.capacity = capacity
+        self.lines = deque(maxlen=capacity)     # 最近的日志
+        self.pending = deque(maxlen=capacity)   # 尚未显示到界面的日志
+        self.dropped = 0                        # 因积压被丢弃, 没有显示到界面的条数
+        self.lock = threading.Lock()
+
+    def append(self, msg):
+        """
+        添加一条日志 (自动加时间戳), 返回加了时间戳的文本
+        """
+        line = f"[{time.strftime('%H:%M:%S')}] {msg}"
+        with self.lock:
+            if len(self.pending) == self.capacity:
+                self.dropped += 1
+            self.lines.append(line)
+            self.pending.append(line)
+        return line
+
+    def drain(self):
+        """
+        取出待显示的日志, 返回 (日志列表, 丢弃条数)
+        """
+        with self.lock:
+            lines = list(self.pending)
+            dropped = self.dropped
+            self.pending.clear()
+            self.dropped = 0
+        return lines, dropped
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.lines)
+
+
+class FileLogSink:
+    """
+    滚动日志文件, 写文件在后台线程进行 (logging 的 QueueHandler/QueueListener),
+    单个文件超过 max_bytes 时滚动, 最多保留 backups 个旧文件
+    """
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                       encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        self.queue = queue.Queue()
+        self.listener = logging.handlers.QueueListener(self.queue, handler)
+        self.listener.start()
+        self.logger = logging.getLogger(f'hugan.log.{id(self)}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(logging.handlers.QueueHandler(self.queue))
+        self.handler = handler
+
+    def write(self, msg):
+        if self.listener is not None:
+            self.logger.info(msg)
+
+    def close(self):
+        """
+        写完队列中剩余的日志后关闭文件
+        """
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        self.handler.close()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
@@ -1,5 +1,6 @@
 import sys
 import os
+import re
 import time
 import importlib.util
 import inspect
@@ -8,14 +9,20 @@ from PySide6 import QtCore, QtWidgets
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtCore import QFile
 # from PySide6 import uic
-from mannager import Manager
+from mannager import Manager, TaskCancelled
+from statemachine import StateMachine
+from scheduler import Scheduler
+from instances import InstancePool
+from logbuffer import LogBuffer, FileLogSink
 from createpictures import ScreenshotWindow
 
 class TaskWorker(QtCore.QThread):
     log_signal = QtCore.Signal(str)
+    iteration_signal = QtCore.Signal(int)   # 已完成的轮数
     finished_signal = QtCore.Signal()
 
-    def __init__(self, func, manager, stop_event: threading.Event, mode=None, mode_args=None):
+    def __init__(self, func, manager, stop_event: threading.Event, mode=None, mode_args=None,
+                 metrics_path=None, metrics_interval=60):
         super().__init__()
         self.func = func
         self.manager = manager
@@ -23,11 +30,35 @@ class TaskWorker(QtCore.QThread):
         # mode: None | 'times' | 'duration'
         self.mode = mode
         self.mode_args = mode_args
+        # 每隔 metrics_interval 秒在日志中输出运行统计, 并写入 metrics_path (可选)
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.last_report = 0.0
+
+    def report_metrics(self, force=False):
+        now = time.time()
+        if not force and now - self.last_report < self.metrics_interval:
+            return
+        self.last_report = now
+        self.log_signal.emit(f'Metrics: {self.manager.metrics.summary()}')
+        if self.metrics_path:
+            try:
+                self.manager.export_metrics(self.metrics_path)
+            except OSError as e:
+                self.log_signal.emit(f'Metrics export error: {e}')
 
     def run(self):
         self.log_signal.emit('Task started')
+        if isinstance(self.func, (StateMachine, Scheduler)):
+            self.func.log = self.log_signal.emit
+        self.manager.metrics.reset()
+        self.last_report = time.time()
+        # 停止请求在任务内部的等待/识别/输入处抛出 TaskCancelled, 不必等整轮结束
+        self.manager.stop_event = self.stop_event
         try:
-            if self.mode == 'times':
+            if isinstance(self.func, Scheduler):
+                self.run_scheduler()
+            elif self.mode == 'times':
                 # mode_args expected to be an int
                 times = int(self.mode_args or 0)
                 self.run_times(times)
@@ -38,9 +69,14 @@ class TaskWorker(QtCore.QThread):
             else:
                 # single run
                 self.func(self.manager)
+                self.iteration_signal.emit(1)
+        except TaskCancelled:
+            self.cancelled()
         except Exception as e:
             self.log_signal.emit(f'Task error: {e}')
         finally:
+            self.manager.stop_event = None
+            self.report_metrics(force=True)
             self.log_signal.emit('Task finished')
             self.finished_signal.emit()
     
@@ -53,6 +89,10 @@ class TaskWorker(QtCore.QThread):
                     break
                 self.func(self.manager)
                 self.log_signal.emit(f'Task iteration {i+1} finished')
+                self.iteration_signal.emit(i + 1)
+                self.report_metrics()
+        except TaskCancelled:
+            self.cancelled()
         except Exception as e:
             self.log_signal.emit(f'Task error: {e}')
         finally:
@@ -62,17 +102,42 @@ class TaskWorker(QtCore.QThread):
         total_seconds = hours * 3600 + mins * 60 + secs
         end_time = time.time() + total_seconds
         self.log_signal.emit(f'Task started for duration {hours}h {mins}m {secs}s')
+        iterations = 0
         try:
             while time.time() < end_time:
                 if self.stop_event.is_set():
                     self.log_signal.emit('Task stopped by user')
                     break
                 self.func(self.manager)
+                iterations += 1
+                self.iteration_signal.emit(iterations)
+                self.report_metrics()
+        except TaskCancelled:
+            self.cancelled()
         except Exception as e:
             self.log_signal.emit(f'Task error: {e}')
         finally:
             self.finished_signal.emit()
 
+    def run_scheduler(self):
+        """
+        多任务调度: 执行一次时每个任务各运行一次, 按次数时每个任务最多运行指定次数, 按时长时不限次数
+        """
+        try:
+            if self.mode == 'times':
+                self.func.run(self.manager, self.stop_event, times=int(self.mode_args or 0))
+            elif self.mode == 'duration':
+                hours, mins, secs = self.mode_args or (0, 0, 0)
+                self.func.run(self.manager, self.stop_event, duration=hours * 3600 + mins * 60 + secs)
+            else:
+                self.func.run(self.manager, self.stop_event, times=1)
+        finally:
+            self.iteration_signal.emit(sum(task.runs for task in self.func.tasks))
+
+    def cancelled(self):
+        self.manager.cancel_input()
+        self.log_signal.emit('Task stopped by user')
+
     def stop(self):
         try:
             self.stop_event.set()
@@ -81,10 +146,22 @@ class TaskWorker(QtCore.QThread):
 
 
 class MainWindow(QtWidgets.QMainWindow):
+    METRICS_PATH = 'metrics.prom'   # 运行统计 (Prometheus 文本格式), 供本地采集器读取
+    LOG_PATH = os.path.join('logs', 'hugan.log')
+    LOG_CAPACITY = 2000             # 界面最多保留的日志行数
+    LOG_FLUSH_MS = 200              # 日志刷新到界面的间隔
+    STOP_TIMEOUT_MS = 2000          # 停止任务时最多等待的时间
+
     def __init__(self):
         super().__init__()
+        # 日志先进入环形缓冲区, 由定时器批量刷新到界面; 同时写入滚动日志文件
+        self.log_buffer = LogBuffer(self.LOG_CAPACITY)
+        self.log_sink = FileLogSink(self.LOG_PATH)
+        self.instances_dirty = False
         self.manager = Manager()
-        self.task_worker = None
+        # 多开: 第一个实例使用 self.manager, 其余实例共享它的模板
+        self.instances = InstancePool(self.manager.templates)
+        self.task_workers = {}      # {实例名: TaskWorker}
         self.loaded_task = None
 
         loader = QUiLoader()
@@ -108,7 +185,17 @@ class MainWindow(QtWidgets.QMainWindow):
         self.btn_stop = self.ui.findChild(QtWidgets.QPushButton, 'btn_stop')
         self.TextBrowser_log = self.ui.findChild(QtWidgets.QTextBrowser, 'TextBrowser_log')
         self.TextBrowser_log.setReadOnly(True)
+        # 多留一行给 flush_log 插入的省略提示, 一次取出的日志全部能显示
+        self.TextBrowser_log.document().setMaximumBlockCount(self.LOG_CAPACITY + 1)
+        self.log_timer = QtCore.QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(self.LOG_FLUSH_MS)
         self.btn_screenshot = self.ui.findChild(QtWidgets.QPushButton, 'btn_screenshot')
+        self.tableWidget_instances = self.ui.findChild(QtWidgets.QTableWidget, 'tableWidget_instances')
+        self.tableWidget_instances.setColumnCount(4)
+        self.tableWidget_instances.setHorizontalHeaderLabels(['实例', '状态', '轮次', '最近消息'])
+        self.tableWidget_instances.horizontalHeader().setStretchLastSection(True)
+        self.tableWidget_instances.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
 
 
         self.btn_connect.clicked.connect(self.on_connect)
@@ -122,29 +209,78 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
     def check_runable(self):
-        if self.manager.has_connected == False or self.loaded_task is None:
+        if not self.instances.connected() or self.loaded_task is None:
             self.log('Please connect and load a task first')
             return False
         return True
 
     def log(self, msg: str):
-        ts = time.strftime('%H:%M:%S')
-        self.TextBrowser_log.append(f'[{ts}] {msg}')
+        self.log_buffer.append(msg)
+        self.log_sink.write(msg)
+
+    def flush_log(self):
+        """
+        定时把缓冲区中的新日志一次性追加到界面, 并刷新实例状态表
+        """
+        lines, dropped = self.log_buffer.drain()
+        if dropped:
+            lines = [f'... 省略 {dropped} 条日志 (见 {self.LOG_PATH})'] + lines
+        if lines:
+            self.TextBrowser_log.append('\n'.join(lines))
+        if self.instances_dirty:
+            self.instances_dirty = False
+            self.refresh_instances()
+
+    def shutdown(self):
+        self.log_timer.stop()
+        self.flush_log()
+        self.log_sink.close()
 
     def on_connect(self):
-        window_name = self.lineEdit_connect.text().strip()
-        ok = self.manager.connect(window_name)
-        self.log('Connect ' + ('succeeded' if ok else 'failed'))
+        if self.is_running():
+            self.log('Task already running')
+            return
+        # 多个窗口标题用分号隔开
+        titles = [title.strip() for title in re.split('[;；]', self.lineEdit_connect.text()) if title.strip()]
+        self.instances.clear()
+        for i, title in enumerate(titles):
+            self.instances.add(title, manager=self.manager if i == 0 else None)
+            ok = self.instances.connect(title)
+            self.log(f'Connect {title} ' + ('succeeded' if ok else 'failed'))
+        self.refresh_instances()
+
+    def refresh_instances(self):
+        rows = self.instances.status()
+        self.tableWidget_instances.setRowCount(len(rows))
+        for row, info in enumerate(rows):
+            values = [info['name'], info['status'], str(info['iterations']), info['last_message']]
+            for col, value in enumerate(values):
+                self.tableWidget_instances.setItem(row, col, QtWidgets.QTableWidgetItem(value))
 
      # Task loading / running
     def on_load_task(self):
-        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Select task file', os.path.dirname(__file__), 'Python Files (*.py)')
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Select task file', os.path.dirname(__file__), 'Task Files (*.py *.json)')
         if not path:
             return
+        if path.endswith('.json'):
+            # 声明式状态机任务
+            try:
+                self.loaded_task = StateMachine.load(path)
+                self.log(f'State machine task loaded from {os.path.basename(path)}')
+            except Exception as e:
+                self.log(f'Load task error: {e}')
+                self.loaded_task = None
+            return
         try:
             spec = importlib.util.spec_from_file_location('user_task_module', path)
             module = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(module)
+            if isinstance(getattr(module, 'SCHEDULE', None), list):
+                # 多个任务协作调度, 见 scheduler.py
+                self.loaded_task = Scheduler(module.SCHEDULE)
+                names = ', '.join(task.name for task in self.loaded_task.tasks)
+                self.log(f'Scheduled tasks loaded from {os.path.basename(path)}: {names}')
+                return
             # find callable task function
             task_func = None
             for name in ('task', 'run', 'main'):
@@ -171,63 +307,95 @@ class MainWindow(QtWidgets.QMainWindow):
     def on_create_task(self):
         pass
 
-    def on_runonce(self):
+    def is_running(self):
+        return any(worker.isRunning() for worker in self.task_workers.values())
+
+    def start_workers(self, mode=None, mode_args=None):
+        """
+        在每个已连接的实例上各启动一个 TaskWorker
+        """
         if self.check_runable() == False:
             return
-        if getattr(self, 'task_worker', None) and self.task_worker.isRunning():
+        if self.is_running():
             self.log('Task already running')
             return
         self.task_stop_event = threading.Event()
-        self.task_worker = TaskWorker(self.loaded_task, self.manager, self.task_stop_event)
-        self.task_worker.log_signal.connect(self.log)
-        self.task_worker.finished_signal.connect(self.task_finished_callback)
-        self.task_worker.start()
+        self.task_workers = {}
+        connected = self.instances.connected()
+        for i, instance in enumerate(connected):
+            task = self.loaded_task
+            if isinstance(task, StateMachine):
+                # 每个实例使用独立的状态机对象, 避免运行记录互相覆盖
+                task = StateMachine(task.spec)
+            elif isinstance(task, Scheduler):
+                task = Scheduler(task.spec, task.min_yield)
+            metrics_path = self.METRICS_PATH if len(connected) == 1 else f'metrics_{i}.prom'
+            worker = TaskWorker(task, instance.manager, self.task_stop_event, mode=mode, mode_args=mode_args,
+                                metrics_path=metrics_path)
+            prefix = f'[{instance.name}] ' if len(connected) > 1 else ''
+            worker.log_signal.connect(lambda msg, instance=instance, prefix=prefix: self.on_worker_log(instance, prefix + msg))
+            worker.iteration_signal.connect(lambda count, instance=instance: self.on_worker_iteration(instance, count))
+            worker.finished_signal.connect(lambda instance=instance: self.task_finished_callback(instance))
+            instance.status = '运行中'
+            instance.iterations = 0
+            self.task_workers[instance.name] = worker
+        for worker in self.task_workers.values():
+            worker.start()
+        self.refresh_instances()
+
+    def on_worker_log(self, instance, msg):
+        self.log(msg)
+        instance.last_message = msg
+        # 状态表随日志定时刷新, 避免每条日志都重绘表格
+        self.instances_dirty = True
+
+    def on_worker_iteration(self, instance, count):
+        instance.iterations = count
+        self.instances_dirty = True
+
+    def on_runonce(self):
+        self.start_workers()
 
     def on_runduration(self):
-        if self.check_runable() == False:
-            return
-        if getattr(self, 'task_worker', None) and self.task_worker.isRunning():
-            self.log('Task already running')
-            return
         t = self.timeEdit_runduration.time()
         hours = t.hour()
         mins = t.minute()
         secs = t.second()
-        self.task_stop_event = threading.Event()
-        self.task_worker = TaskWorker(self.loaded_task, self.manager, self.task_stop_event, mode='duration', mode_args=(hours, mins, secs))
-        self.task_worker.log_signal.connect(self.log)
-        self.task_worker.finished_signal.connect(self.task_finished_callback)
-        self.task_worker.start()
+        self.start_workers('duration', (hours, mins, secs))
 
     def on_runtimes(self):
-        if self.check_runable() == False:
-            return
-        if getattr(self, 'task_worker', None) and self.task_worker.isRunning():
-            self.log('Task already running')
-            return
         times = self.spinBox_runtimes.value()
-        self.task_stop_event = threading.Event()
-        self.task_worker = TaskWorker(self.loaded_task, self.manager, self.task_stop_event, mode='times', mode_args=times)
-        self.task_worker.log_signal.connect(self.log)
-        self.task_worker.finished_signal.connect(self.task_finished_callback)
-        self.task_worker.start()
+        self.start_workers('times', times)
 
 
-    def task_finished_callback(self):
-        self.task_worker = None
+    def task_finished_callback(self, instance):
+        instance.status = '空闲'
+        self.refresh_instances()
 
     def on_stop(self):
-        if getattr(self, 'task_worker', None):
+        start = time.perf_counter()
+        for worker in self.task_workers.values():
+            worker.stop()
+        deadline = start + self.STOP_TIMEOUT_MS / 1000
+        for name, worker in self.task_workers.items():
             try:
-                self.task_worker.stop()
-                self.task_worker.wait(1)
-                self.log('Task stop requested')
+                remaining = max(int((deadline - time.perf_counter()) * 1000), 0)
+                if worker.wait(remaining):
+                    latency = time.perf_counter() - start
+                    worker.manager.metrics.observe('stop_latency', latency)
+                    self.log(f'Task stopped: {name} ({latency * 1000:.0f} ms)')
+                else:
+                    self.log(f'Task stop requested: {name} (still running after {self.STOP_TIMEOUT_MS} ms)')
             except Exception as e:
                 self.log(f'Error stopping task: {e}')
 
     def on_open_screenshot(self):
         try:
-            self.screenshot_window = ScreenshotWindow(fixed_x=self.manager.win_controller.window_left, fixed_y=self.manager.win_controller.window_top)
+            controller = self.manager.win_controller
+            client_origin = controller.client_origin() if controller.game_hwnd else None
+            self.screenshot_window = ScreenshotWindow(fixed_x=controller.window_left, fixed_y=controller.window_top,
+                                                      window_size=(controller.client_rect[2], controller.client_rect[3]),
+                                                      client_origin=client_origin)
             #self.screenshot_window.finished.connect(self.on_screenshot_finished)
             self.screenshot_window.show()
         except Exception as e:
@@ -237,6 +405,7 @@ class MainWindow(QtWidgets.QMainWindow):
 def main():
     app = QtWidgets.QApplication(sys.argv)
     w = MainWindow()
+    app.aboutToQuit.connect(w.shutdown)
     w.ui.show()
     sys.exit(app.exec())
 
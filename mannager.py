@@ -1,11 +1,24 @@
 import re
 from mumucontroller import MuMuController
-from piccheck import compare_images
+from capture import make_capture
+from recorder import SessionRecorder, RecordingCapture
+from templatepack import load_pack
+from templatemanifest import template_entries, manifest_resolution, manifest_dpi_scale, TemplateRegistry
+from templatescale import scale_templates
+from gridscan import scan_grid, scan_region
+from inputqueue import InputQueue
+from metrics import Metrics
+from piccheck import (prepare_template, similarity, SIMILARITY_METRICS, prepare_batch, compare_batch,
+                      coarse_score, roi_fingerprint, roi_unchanged, find_template)
 from time import sleep
-from PIL import ImageGrab, Image
+from PIL import Image
 import numpy as np
+import cv2
 import os
 import time
+import threading
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 def load_pic(path):
     """
     加载图片并转换为RGB数组
@@ -15,27 +28,291 @@ def load_pic(path):
     return [np.array(Image.open(path).convert('RGB')),[top_x, top_y, bottom_x, bottom_y]]
 
 
-class Manager:
+class TaskCancelled(Exception):
+    """
+    任务被停止: 设置 Manager.stop_event 后, 下一个检查点 (等待, 识别, 输入) 抛出
+    """
+
+
+class TemplateStore:
+    """
+    模板数据: 原图和坐标, 按需生成的预处理特征, 批量比较计划
+    加载完成后只读, 可以被多个 Manager 共享 (多开时只加载一份模板)
+    """
+    DEFAULT_METRIC = 'edge_ssim'
+    DEFAULT_THRESHOLD = 0.8
+
     def __init__(self):
-        self.win_controller = MuMuController()
         self.original_pic_data = {}
+        self.pic_features = {}      # 模板预处理缓存 {name: {(threshold1, threshold2): features}}, 首次使用时生成
+        self.template_packs = {}    # {name: TemplatePack}, 从模板包加载的模板
+        self.batch_plans = {}       # picmath_many 的批量比较计划缓存
+        self.metric_config = {}     # {name: (相似度指标, 阈值)}, 未设置的模板使用 edge_ssim 和 DEFAULT_THRESHOLD
+        self.registry = TemplateRegistry()  # 模板清单条目, 按名称/分组/区域索引
+        self.base_resolution = None # 截取模板时的客户区大小 (宽, 高), 来自清单的 resolution
+        self.base_dpi_scale = 1.0   # 截取模板时的 DPI 缩放比例, 来自清单的 dpi_scale
+        self.sources = []           # [(模板目录, 实际加载的条目, use_pack)], 生成缩放模板时使用
+        self.scaled_stores = {}     # {(宽, 高): 缩放后的 TemplateStore}
+
+    def load(self, path, use_pack=True):
+        """
+        加载模板目录, 模板列表来自目录下的 manifest.json 和按文件名规则命名的图片
+        (见 templatemanifest.template_entries)
+        use_pack=True 时通过模板包 (见 templatepack.load_pack) 加载, 只有变化了的图片需要解码,
+        模板数据通过 mmap 在第一次使用时才读入
+        """
+        if self.base_resolution is None:
+            self.base_resolution = manifest_resolution(path)
+            self.base_dpi_scale = manifest_dpi_scale(path)
+        self.load_entries(path, template_entries(path), use_pack)
+
+    def load_entries(self, path, entries, use_pack=True):
+        """
+        加载模板目录中指定的模板条目
+        """
+        pack = load_pack(path, entries=entries) if use_pack else None
+        loaded = []
+        for entry in entries:
+            name = entry['name']
+            if name in self.original_pic_data:
+                print(f"图片 {name} 已存在，跳过加载")
+                continue
+            if pack is not None:
+                rgb = pack.rgb(name)
+                self.template_packs[name] = pack
+            else:
+                rgb = np.array(Image.open(os.path.join(path, entry['file'])).convert('RGB'))
+            self.original_pic_data[name] = [rgb, list(entry['roi'])]
+            self.registry.add(entry)
+            loaded.append(entry)
+            if 'metric' in entry or 'threshold' in entry:
+                self.set_metric(name, entry.get('metric', self.DEFAULT_METRIC),
+                                entry.get('threshold', self.DEFAULT_THRESHOLD))
+        self.sources.append((path, loaded, use_pack))
+
+    def scaled(self, width, height):
+        """
+        适配 width x height 客户区的模板, 缩放结果缓存在磁盘上 (见 templatescale),
+        同一分辨率只生成一次; 没有基准分辨率或分辨率相同时返回自身
+        """
+        size = (width, height)
+        if self.base_resolution is None or tuple(self.base_resolution) == size:
+            return self
+        if size not in self.scaled_stores:
+            store = TemplateStore()
+            store.base_resolution = size
+            store.base_dpi_scale = self.base_dpi_scale
+            for path, entries, use_pack in self.sources:
+                images = {entry['name']: self.original_pic_data[entry['name']][0] for entry in entries}
+                directory, scaled_entries = scale_templates(path, entries, images, self.base_resolution, size)
+                store.load_entries(directory, scaled_entries, use_pack)
+            store.metric_config.update(self.metric_config)
+            self.scaled_stores[size] = store
+        return self.scaled_stores[size]
+
+    def get_features(self, name, threshold1=100, threshold2=200):
+        cache = self.pic_features.setdefault(name, {})
+        key = (threshold1, threshold2)
+        if key not in cache:
+            pack = self.template_packs.get(name)
+            if pack is not None and pack.thresholds == key:
+                # 模板包中已有灰度图和边缘图
+                cache[key] = prepare_template(pack.rgb(name), threshold1, threshold2, pack.gray(name), pack.edges(name))
+            else:
+                cache[key] = prepare_template(self.original_pic_data[name][0], threshold1, threshold2)
+        return cache[key]
+
+    def set_metric(self, name, metric=DEFAULT_METRIC, threshold=DEFAULT_THRESHOLD):
+        """
+        设置模板使用的相似度指标 (见 piccheck.SIMILARITY_METRICS) 和判定阈值
+        """
+        if metric not in SIMILARITY_METRICS:
+            raise ValueError(f'未知的相似度指标: {metric}')
+        self.metric_config[name] = (metric, threshold)
+
+    def metric_for(self, name):
+        """
+        返回 (相似度指标, 阈值)
+        """
+        return self.metric_config.get(name, (self.DEFAULT_METRIC, self.DEFAULT_THRESHOLD))
+
+    def get_batch_plan(self, names, threshold1=100, threshold2=200):
+        key = (tuple(names), threshold1, threshold2)
+        if key not in self.batch_plans:
+            self.batch_plans[key] = prepare_batch([
+                (self.get_features(name, threshold1, threshold2), self.original_pic_data[name][1])
+                for name in names
+            ])
+        return self.batch_plans[key]
+
+
+class Manager:
+    def __init__(self, capture='imagegrab', controller=None, templates=None):
+        """
+        capture: 截图方式, 见 capture.make_capture
+        controller: 输入控制器, 默认 MuMuController (回放时传入 recorder.ReplayController)
+        templates: 共享的 TemplateStore, 不指定时新建并加载 pictures 目录
+        """
+        self.win_controller = controller if controller is not None else MuMuController()
+        self.capture = make_capture(capture, self.win_controller)
+        self.templates = templates if templates is not None else TemplateStore()
+        self.base_templates = self.templates    # 基准分辨率的模板, 连接后按窗口大小换成缩放后的模板
+        self.original_pic_data = self.templates.original_pic_data
+        self.coord_scale = (1.0, 1.0)   # 当前客户区相对模板基准分辨率的缩放比例 (截图像素)
+        self.input_scale = (1.0, 1.0)   # key_xy 等输入坐标的缩放比例, 另外考虑了 DPI 缩放的变化
+        self.resolution = None          # 当前使用的客户区大小 (宽, 高), 见 use_resolution
         self.dict_key = {}
-        self.loadpicinfo("pictures")
+        # snapshot() 期间缓存的整幅客户区截图, 按线程保存 (见 frame):
+        # 调度器运行时任务在快照中让出控制权, 其他任务不能用到这张旧截图
+        self.local = threading.local()
+        self.recognition_slots = None   # 多开时限制同时识别的线程数 (threading.Semaphore)
+        self.recognition_pool = None    # 并行识别线程池, 见 set_recognition_threads
+        self.recognition_chunk = 4      # 并行时每个线程一次计算的模板数
+        self.parallel_min_batch = 8     # 模板数少于此值时仍然串行计算
+        self.clock = time.monotonic # 计时和等待函数, 回放时替换为虚拟时钟
+        self.sleep = sleep
+        self.last_input_time = 0.0  # 最近一次输入操作的时间 (self.clock)
+        self.recorder = None        # 录制中的 SessionRecorder
+        self.stop_event = None      # threading.Event, 设置后在检查点抛出 TaskCancelled (见 checkpoint)
+        self.scheduler = None       # 运行中的 scheduler.Scheduler, 等待时让出控制权
+        self.input_queue = None     # 异步输入队列, 见 enable_input_queue
+        self.metrics = Metrics()    # 各阶段耗时和识别命中统计
+        self.win_controller.metrics = self.metrics
+        # 区域变化检测: 截图区域与上次相同时直接返回上次的分数
+        self.roi_cache_enabled = True
+        self.roi_tolerance = 2
+        self.roi_cache = {}         # {(name, threshold1, threshold2): (指纹, 分数)}
+        self.roi_cache_stats = {'hits': 0, 'misses': 0}
+        # 级联匹配: 缩略灰度相关系数远低于阈值时直接判为未出现, 其余情况做完整比较
+        # (缩略图相关系数很高时完整分数仍可能低于阈值, 例如有噪点时的边缘SSIM, 所以不提前判为出现)
+        # 粗判只看灰度形状, 只用于 cascade_metrics 中的指标; 颜色直方图等指标的模板总是计算完整分数
+        self.cascade_enabled = False
+        self.cascade_metrics = ('edge_ssim', 'ncc')
+        self.cascade_reject = 0.5   # 粗判分数不超过 min(cascade_reject, threshold - cascade_margin) 时判为未出现
+        self.cascade_margin = 0.3
+        self.cascade_stats = {'reject': 0, 'full': 0}
+        if templates is None:
+            self.loadpicinfo("pictures")
         self.loadkeyinfo("key_xy.txt")
         self.has_connected = False
         
     def connect(self, title):
         if self.win_controller.connect(title):
             self.has_connected = True
+            self.use_resolution(self.win_controller.client_rect[2], self.win_controller.client_rect[3])
             return True
         return False
 
-
-    def click(self, x, y):
-        self.win_controller.click(x, y)
+    def use_resolution(self, width, height, dpi_scale=None):
+        """
+        按客户区大小切换到对应分辨率的模板 (见 TemplateStore.scaled), 并缩放 key_xy 的坐标
+
+        截图后端按 client_rect 的像素截图, 模板只需按客户区大小缩放;
+        输入坐标发送前还会乘以 dpi_scale (见 MuMuController._adjust_coords),
+        所以 key_xy 的坐标按客户区大小缩放后再换算 DPI 缩放的变化
+        dpi_scale: 当前窗口的 DPI 缩放比例, None 时取 win_controller.dpi_scale
+        """
+        base = self.base_templates.base_resolution
+        if not width or not height or base is None:
+            return
+        if dpi_scale is None:
+            dpi_scale = getattr(self.win_controller, 'dpi_scale', 1.0)
+        with self.metrics.timer('scale_templates'):
+            self.templates = self.base_templates.scaled(width, height)
+        self.original_pic_data = self.templates.original_pic_data
+        self.resolution = (width, height)
+        self.coord_scale = (width / base[0], height / base[1])
+        ratio = self.base_templates.base_dpi_scale / dpi_scale
+        self.input_scale = (self.coord_scale[0] * ratio, self.coord_scale[1] * ratio)
+        self.reset_roi_cache()
+
+
+    def enable_input_queue(self):
+        """
+        启用异步输入: 之后 click/press/swipe 立即返回 Future, 由后台线程发送输入
+        发送线程总是按真实时间调度: 回放时 self.clock 是虚拟时钟, 只在 wait 时前进,
+        用它调度的输入永远不会发出
+        """
+        if self.input_queue is None:
+            self.input_queue = InputQueue(self.win_controller)
+
+    def disable_input_queue(self, wait=True):
+        if self.input_queue is not None:
+            self.input_queue.close(wait)
+            self.input_queue = None
+
+    def cancel_input(self):
+        """
+        丢弃异步输入队列中还没执行的输入 (任务被停止时调用)
+        """
+        if self.input_queue is not None:
+            self.input_queue.cancel()
+
+    def wait_input(self, timeout=None):
+        """
+        等待异步输入队列中的操作全部执行完
+        """
+        if self.input_queue is None:
+            return True
+        if self.stop_event is None:
+            return self.input_queue.join(timeout)
+        # 分段等待, 每段之间检查停止请求
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.checkpoint()
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.input_queue.join(0.1 if remaining is None else min(remaining, 0.1)):
+                return True
+
+    def checkpoint(self):
+        """
+        取消检查点: stop_event 已设置时抛出 TaskCancelled
+        """
+        if self.stop_event is not None and self.stop_event.is_set():
+            raise TaskCancelled()
+
+    def click(self, x, y, gap=0.0):
+        self.checkpoint()
+        if self.recorder is not None:
+            self.recorder.record_input('click', x=x, y=y)
+        self.last_input_time = self.clock()
+        if self.input_queue is not None:
+            return self.input_queue.click(x, y, gap=gap)
+        with self.metrics.timer('click'):
+            return self.win_controller.click(x, y)
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0.5):
+        self.checkpoint()
+        if self.recorder is not None:
+            self.recorder.record_input('swipe', start_x=start_x, start_y=start_y,
+                                       end_x=end_x, end_y=end_y, duration=duration)
+        self.last_input_time = self.clock()
+        if self.input_queue is not None:
+            return self.input_queue.swipe(start_x, start_y, end_x, end_y, duration)
+        with self.metrics.timer('swipe'):
+            return self.win_controller.swipe(start_x, start_y, end_x, end_y, duration)
+
+    def gesture(self, gesture):
+        """
+        执行手势 (见 gesture.Gesture), 同步执行时返回执行报告, 异步输入时返回 Future
+        """
+        self.checkpoint()
+        if self.recorder is not None:
+            self.recorder.record_input('gesture', events=gesture.events)
+        self.last_input_time = self.clock()
+        if self.input_queue is not None:
+            return self.input_queue.gesture(gesture)
+        with self.metrics.timer('gesture'):
+            return self.win_controller.play_gesture(gesture)
 
     def press(self, key, times=1):
         key_x, key_y = self.dict_key[key]
+        key_x, key_y = int(round(key_x * self.input_scale[0])), int(round(key_y * self.input_scale[1]))
+        if self.input_queue is not None:
+            # 异步输入时按键间隔由队列保证, 不阻塞调用方
+            return [self.click(key_x, key_y, gap=0.05) for i in range(times)]
         for i in range(times):
             self.click(key_x, key_y)
             self.wait(0.05)
@@ -45,50 +322,424 @@ class Manager:
     #         self.wait(0.05)
 
     def wait(self, seconds):
-        sleep(seconds)
+        """
+        等待 seconds 秒; 设置了 stop_event 时停止请求会立即打断等待并抛出 TaskCancelled
+        由 scheduler.Scheduler 运行时, 较长的等待会把控制权让给其他任务
+        """
+        self.checkpoint()
+        if self.scheduler is not None and self.scheduler.should_yield(seconds):
+            with self.scheduler.yielding():
+                self._sleep(seconds)
+        else:
+            self._sleep(seconds)
+        self.checkpoint()
+
+    def _sleep(self, seconds):
+        with self.metrics.timer('wait'):
+            if self.stop_event is not None and self.sleep is sleep:
+                self.stop_event.wait(seconds)
+            else:
+                # 回放时使用虚拟时钟的 sleep, 等待结束后再检查
+                self.sleep(seconds)
+
+    def exclusive(self):
+        """
+        由调度器运行时, with manager.exclusive(): 中的等待不让出控制权
+        """
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.exclusive()
+
+    def export_metrics(self, path):
+        """
+        导出运行统计, 格式按扩展名选择 (.json / .csv / .prom), 见 metrics.Metrics.write
+        """
+        self.metrics.write(path)
+
+    def start_recording(self, path):
+        """
+        开始录制: 之后每次截图和输入操作都记录到 path 目录, 见 recorder.SessionRecorder
+        """
+        if self.recorder is not None:
+            self.stop_recording()
+        self.recorder = SessionRecorder(path, self.clock)
+        self.capture = RecordingCapture(self.capture, self.recorder)
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.capture = self.capture.inner
+        self.recorder.close()
+        self.recorder = None
 
     def grab(self,x_top, y_top, x_bottom, y_bottom):
-        region = (
-            self.win_controller.window_left + x_top,
-            self.win_controller.window_top + y_top,
-            self.win_controller.window_left + x_bottom,
-            self.win_controller.window_top + y_bottom,
-        )
-
         # 截图
-        return ImageGrab.grab(bbox=region)
-    def picmath(self, name, threshold=0.8):
-        original_pic_data = self.original_pic_data[name][0]
+        with self.metrics.timer('grab'):
+            return Image.fromarray(self.capture.grab(x_top, y_top, x_bottom, y_bottom))
+
+    def grab_client(self):
+        """
+        截取整个游戏客户区, 返回RGB数组
+        """
+        with self.metrics.timer('grab'):
+            return self.capture.grab_client()
+
+    @property
+    def frame(self):
+        return getattr(self.local, 'frame', None)
+
+    @frame.setter
+    def frame(self, frame):
+        self.local.frame = frame
+
+    @contextmanager
+    def snapshot(self):
+        """
+        截一次图供多次识别使用, with 块内的 picmath 都从这张截图中裁剪
+
+        with manager.snapshot():
+            if manager.picmath("gold"): ...
+            if manager.picmath("water"): ...
+        """
+        last_frame = self.frame
+        self.frame = self.grab_client()
+        try:
+            yield self.frame
+        finally:
+            self.frame = last_frame
+
+    def grab_roi(self, x_top, y_top, x_bottom, y_bottom):
+        """
+        获取指定区域的RGB数组, 有快照时直接裁剪快照, 否则单独截图
+        """
+        if self.frame is not None:
+            return np.ascontiguousarray(self.frame[y_top:y_bottom, x_top:x_bottom])
+        with self.metrics.timer('grab'):
+            return self.capture.grab(x_top, y_top, x_bottom, y_bottom)
+
+    def recognition_slot(self):
+        """
+        识别计算前获取的名额, 没有设置 recognition_slots 时不限制
+        """
+        return self.recognition_slots if self.recognition_slots is not None else nullcontext()
+
+    def get_pic_features(self, name, threshold1=100, threshold2=200):
+        """
+        获取模板的预处理特征, 按Canny阈值缓存
+        """
+        return self.templates.get_features(name, threshold1, threshold2)
+
+    def picscore(self, name, threshold1=100, threshold2=200, metric=None):
+        """
+        计算模板与当前画面对应区域的相似度分数
+        metric: 相似度指标, None 时使用模板设置的指标 (见 TemplateStore.set_metric)
+        """
+        if metric is None:
+            metric = self.templates.metric_for(name)[0]
         original_pic_location = self.original_pic_data[name][1]
+        features = self.get_pic_features(name, threshold1, threshold2)
 
-        grap_pic = self.grab(original_pic_location[0], original_pic_location[1], original_pic_location[2], original_pic_location[3])
-        grap_pic = np.array(grap_pic.convert('RGB'))
+        grap_pic = self.grab_roi(original_pic_location[0], original_pic_location[1], original_pic_location[2], original_pic_location[3])
 
-            # 计算绝对差异
-        score = compare_images(original_pic_data, grap_pic)
+        # 区域没有变化时跳过边缘和SSIM计算
+        key = (name, threshold1, threshold2, metric)
+        fingerprint = roi_fingerprint(grap_pic)
+        if self._roi_cache_hit([key], [fingerprint]):
+            return self.roi_cache[key][1]
 
-        # 判断是否在阈值范围内
-        return score >= threshold
+            # 计算绝对差异
+        with self.recognition_slot():
+            score = similarity(features, grap_pic, metric, self.metrics)
+        self.roi_cache[key] = (fingerprint, score)
+        return score
+
+    def _roi_cache_hit(self, keys, fingerprints):
+        """
+        所有区域都与上次截图相同时命中缓存, 并更新命中/未命中计数
+        """
+        hit = self.roi_cache_enabled and all(
+            key in self.roi_cache and roi_unchanged(self.roi_cache[key][0], fingerprint, self.roi_tolerance)
+            for key, fingerprint in zip(keys, fingerprints)
+        )
+        self.roi_cache_stats['hits' if hit else 'misses'] += len(keys)
+        self.metrics.count('roi_cache', len(keys), result='hit' if hit else 'miss')
+        return hit
+
+    def set_recognition_threads(self, workers):
+        """
+        设置 picmath_many 使用的识别线程数, workers <= 1 时关闭线程池改为串行
+        """
+        if self.recognition_pool is not None:
+            self.recognition_pool.shutdown(wait=True)
+            self.recognition_pool = None
+        if workers and workers > 1:
+            self.recognition_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition')
+
+    def reset_roi_cache(self):
+        self.roi_cache.clear()
+        self.roi_cache_stats = {'hits': 0, 'misses': 0}
+
+    def picmath(self, name, threshold=None, threshold1=100, threshold2=200, cascade=None, metric=None):
+        """
+        threshold, metric: 判定阈值和相似度指标, None 时使用模板的设置 (见 TemplateStore.set_metric)
+        cascade: 是否使用级联匹配, None 时取 self.cascade_enabled; 指标不在 cascade_metrics 中时不使用
+        """
+        self.checkpoint()
+        default_metric, default_threshold = self.templates.metric_for(name)
+        metric = metric or default_metric
+        if threshold is None:
+            threshold = default_threshold
+        if cascade is None:
+            cascade = self.cascade_enabled
+        with self.metrics.timer('picmath'):
+            if cascade and metric in self.cascade_metrics:
+                matched = self._cascade_match(name, threshold, threshold1, threshold2, metric)
+            else:
+                # 判断是否在阈值范围内
+                matched = self.picscore(name, threshold1, threshold2, metric) >= threshold
+        self.metrics.count('picmath', template=name, result='hit' if matched else 'miss')
+        return matched
+
+    def _cascade_match(self, name, threshold, threshold1, threshold2, metric):
+        """
+        级联匹配: 先用缩略灰度图的相关系数粗判, 远低于阈值时直接返回 False, 否则计算完整分数
+        """
+        x_top, y_top, x_bottom, y_bottom = self.original_pic_data[name][1]
+        features = self.get_pic_features(name, threshold1, threshold2)
+        grap_pic = self.grab_roi(x_top, y_top, x_bottom, y_bottom)
+
+        key = (name, threshold1, threshold2, metric)
+        fingerprint = roi_fingerprint(grap_pic)
+        if self._roi_cache_hit([key], [fingerprint]):
+            return self.roi_cache[key][1] >= threshold
+
+        with self.metrics.timer('cascade_coarse'):
+            coarse = coarse_score(features, grap_pic)
+        if coarse is not None and coarse <= min(self.cascade_reject, threshold - self.cascade_margin):
+            stage, matched = 'reject', False
+        else:
+            with self.recognition_slot():
+                score = similarity(features, grap_pic, metric, self.metrics)
+            self.roi_cache[key] = (fingerprint, score)
+            stage, matched = 'full', score >= threshold
+        self.cascade_stats[stage] += 1
+        self.metrics.count('cascade', template=name, stage=stage)
+        return matched
+
+    def cascade_exit_rates(self):
+        """
+        级联匹配各阶段的退出比例 {'reject': ..., 'full': ...}, 用于调整 cascade_reject/cascade_margin
+        """
+        total = sum(self.cascade_stats.values())
+        return {stage: (count / total if total else 0.0) for stage, count in self.cascade_stats.items()}
+
+    def reset_cascade_stats(self):
+        self.cascade_stats = {'reject': 0, 'full': 0}
+
+    def picmath_many(self, names, threshold1=100, threshold2=200):
+        """
+        一次截图计算多个模板的分数, 每个模板使用自己设置的相似度指标
+
+        返回:
+        {模板名: 相似度分数}
+        """
+        self.checkpoint()
+        with self.metrics.timer('picmath_many'):
+            names = tuple(names)
+            metric_names = [self.templates.metric_for(name)[0] for name in names]
+            frame, (ox, oy) = self._grab_union(names)
+
+            # 所有区域都没有变化时跳过整批计算
+            keys = [(name, threshold1, threshold2, metric) for name, metric in zip(names, metric_names)]
+            fingerprints = []
+            for name in names:
+                x_top, y_top, x_bottom, y_bottom = self.original_pic_data[name][1]
+                fingerprints.append(roi_fingerprint(frame[y_top - oy:y_bottom - oy, x_top - ox:x_bottom - ox]))
+            if self._roi_cache_hit(keys, fingerprints):
+                return {name: self.roi_cache[key][1] for name, key in zip(names, keys)}
+
+            # edge_ssim 的模板一起批量计算, 其他指标逐个计算
+            batch = tuple(name for name, metric in zip(names, metric_names) if metric == 'edge_ssim')
+            scores = {}
+            if batch:
+                plan = self.templates.get_batch_plan(batch, threshold1, threshold2)
+                # 模板很少时线程调度的开销大于收益, 直接串行
+                executor = self.recognition_pool if len(batch) >= self.parallel_min_batch else None
+                if executor is None:
+                    with self.recognition_slot():
+                        batch_scores = compare_batch(frame, plan, self.metrics, None, self.recognition_chunk, (ox, oy))
+                else:
+                    # 并行时每块各自获取一个识别名额, 多开时同时识别的线程数仍不超过 recognition_slots
+                    batch_scores = compare_batch(frame, plan, self.metrics, executor, self.recognition_chunk, (ox, oy),
+                                                 guard=self.recognition_slot())
+                scores.update(zip(batch, batch_scores.tolist()))
+            with self.recognition_slot():
+                for name, metric in zip(names, metric_names):
+                    if metric != 'edge_ssim':
+                        x_top, y_top, x_bottom, y_bottom = self.original_pic_data[name][1]
+                        region = np.ascontiguousarray(frame[y_top - oy:y_bottom - oy, x_top - ox:x_bottom - ox])
+                        features = self.get_pic_features(name, threshold1, threshold2)
+                        scores[name] = similarity(features, region, metric, self.metrics)
+            for cache_key, fingerprint in zip(keys, fingerprints):
+                self.roi_cache[cache_key] = (fingerprint, scores[cache_key[0]])
+            return {name: scores[name] for name in names}
     
-    def loadpicinfo(self, path):
-        #递归遍历目录下所有png图片
-        name_pattern = re.compile('(\w+)_(\d+)_(\d+)_(\d+)_(\d+).png')
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                math_obj = name_pattern.match(file)
-                if math_obj:
-                    #print(os.path.join(root, file))
-
-                    name = math_obj.group(1)
-                    top_x = int(math_obj.group(2))
-                    top_y = int(math_obj.group(3))
-                    bottom_x = int(math_obj.group(4))
-                    bottom_y = int(math_obj.group(5))
-                    if name in self.original_pic_data:
-                        print(f"图片 {name} 已存在，跳过加载")
-                    else:
-                        file_path = os.path.join(root, file)
-                        self.original_pic_data[name] = [np.array(Image.open(file_path).convert('RGB')),[top_x, top_y, bottom_x, bottom_y]]
+    def _grab_union(self, names):
+        """
+        截取覆盖所有模板区域的最小矩形, 返回 (RGB数组, 左上角的客户区坐标)
+        有快照时直接使用快照; 只等少数几个模板时不必截取整个客户区
+        """
+        if self.frame is not None:
+            return self.frame, (0, 0)
+        rects = [self.original_pic_data[name][1] for name in names]
+        x_top, y_top = min(rect[0] for rect in rects), min(rect[1] for rect in rects)
+        x_bottom, y_bottom = max(rect[2] for rect in rects), max(rect[3] for rect in rects)
+        return self.grab_roi(x_top, y_top, x_bottom, y_bottom), (x_top, y_top)
+
+    def find(self, name, search_region=None, click_space=True):
+        """
+        在搜索区域内查找模板的位置, 不要求模板在文件名记录的坐标上
+
+        参数:
+        name: 模板名
+        search_region: [x1, y1, x2, y2] 截图像素的客户区坐标 (与模板坐标相同),
+                       None 时使用清单中的 search_region, 清单没有则为整个客户区
+        click_space: True 时返回点击坐标 (与 scan_grid 相同, 可以直接传给 click),
+                     False 时返回截图像素坐标 (可以用于裁剪截图); 两者只差 DPI 缩放
+
+        返回:
+        ([x1, y1, x2, y2] 匹配位置, 分数), 搜索区域比模板小时返回 (None, 0.0)
+        """
+        self.checkpoint()
+        if search_region is None and name in self.templates.registry:
+            search_region = self.templates.registry.get(name).get('search_region')
+        if search_region is None:
+            search_region = [0, 0, *self.capture.client_size()]
+        x_top, y_top, x_bottom, y_bottom = search_region
+        region = cv2.cvtColor(self.grab_roi(x_top, y_top, x_bottom, y_bottom), cv2.COLOR_BGR2GRAY)
+        template = self.get_pic_features(name)['gray']
+
+        with self.metrics.timer('find'), self.recognition_slot():
+            location, score = find_template(region, template)
+        if location is None:
+            return None, 0.0
+        height, width = template.shape[:2]
+        x, y = location[0] + x_top, location[1] + y_top
+        rect = [x, y, x + width, y + height]
+        if click_space:
+            rect = [int(round(v * self.click_per_pixel())) for v in rect]
+        return rect, score
+
+    def click_per_pixel(self):
+        """
+        截图像素坐标换算成点击坐标的比例 (点击坐标发送前会乘以 dpi_scale, 见 use_resolution)
+        """
+        return self.input_scale[0] / (self.coord_scale[0] * self.base_templates.base_dpi_scale)
+
+    def scan_grid(self, lattice, names, threshold=0.6, jitter=2, top=None):
+        """
+        一次截图给网格的所有格子打分, 返回按分数从高到低排列的候选格子
+
+        参数:
+        lattice: gridscan.Lattice, 坐标为模板基准分辨率下的点击坐标 (与 key_xy 相同)
+        names: 格子外观的模板名列表 (模板中心对准格子中心)
+        threshold: 归一化相关系数阈值, 低于阈值的格子不返回
+        jitter: 允许格子中心偏移的像素数
+        top: 最多返回的格子数
+
+        返回:
+        [{'i', 'j', 'x', 'y', 'score', 'template'}, ...], x, y 可以直接传给 click
+        """
+        self.checkpoint()
+        with self.metrics.timer('scan_grid'):
+            templates = [self.get_pic_features(name)['gray'] for name in names]
+            # 截图像素中的格子中心, 和传给 click 的坐标 (两者只差 DPI 缩放)
+            base_dpi = self.base_templates.base_dpi_scale
+            points = lattice.points((self.coord_scale[0] * base_dpi, self.coord_scale[1] * base_dpi))
+            click_points = lattice.points(self.input_scale)
+            margin = max(max(template.shape[:2]) for template in templates) + jitter
+            x_top, y_top, x_bottom, y_bottom = scan_region(points, margin, self.capture.client_size())
+            region = cv2.cvtColor(self.grab_roi(x_top, y_top, x_bottom, y_bottom), cv2.COLOR_BGR2GRAY)
+            with self.recognition_slot():
+                scores, best = scan_grid(region, points - (x_top, y_top), templates, jitter)
+
+            order = np.argsort(-scores, kind='stable')
+            order = order[(scores[order] >= threshold) & (best[order] >= 0)][:top]
+            ij = lattice.indices()
+            return [{'i': int(ij[k, 0]), 'j': int(ij[k, 1]), 'x': int(click_points[k, 0]), 'y': int(click_points[k, 1]),
+                     'score': float(scores[k]), 'template': names[best[k]]} for k in order]
+
+    def templates_in(self, group=None, region=None):
+        """
+        查询模板名: 属于 group 分组 和/或 坐标与 region [x1, y1, x2, y2] 相交, 都不指定时返回全部模板
+        结果可直接传给 picmath_many / wait_any, 在同一张截图上一起识别
+        """
+        registry = self.templates.registry
+        if region is not None:
+            return registry.in_region(region, group)
+        if group is not None:
+            return registry.group(group)
+        return registry.names()
+
+    def wait_until(self, name, timeout=None, threshold=None, **kwargs):
+        """
+        等待单个模板出现, 参数同 wait_any
+        """
+        return self.wait_any([name], timeout, threshold, **kwargs)
+
+    def wait_any(self, names, timeout=None, threshold=None, min_interval=0.05, max_interval=1.0,
+                 backoff=1.5, input_settle=1.0):
+        """
+        等待任意一个模板出现, 自适应调整轮询间隔:
+        刚有输入操作或画面在变化时按 min_interval 快速轮询,
+        画面静止时按 backoff 倍数逐步放慢, 最多到 max_interval
+
+        参数:
+        names: 模板名列表, 同时出现时按列表顺序优先
+        timeout: 超时秒数, None 表示一直等待
+        threshold: 相似度阈值, 也可以是 {模板名: 阈值}, None 时使用模板设置的阈值
+        input_settle: 输入操作后保持快速轮询的秒数
+
+        返回:
+        (匹配到的模板名, 耗时秒数), 超时返回 (None, 耗时秒数)
+        """
+        if not isinstance(threshold, dict):
+            threshold = dict.fromkeys(names, threshold)
+        threshold = {name: self.templates.metric_for(name)[1] if threshold.get(name) is None else threshold[name]
+                     for name in names}
+        start = self.clock()
+        interval = min_interval
+        last_scores = None
+        while True:
+            scores = self.picmath_many(names)
+            elapsed = self.clock() - start
+            for name in names:
+                if scores[name] >= threshold[name]:
+                    return name, elapsed
+            if timeout is not None and elapsed >= timeout:
+                return None, elapsed
+
+            changed = last_scores is not None and any(
+                abs(scores[name] - last_scores[name]) > 0.01 for name in names)
+            if changed or self.clock() - self.last_input_time < input_settle:
+                interval = min_interval
+            else:
+                interval = min(interval * backoff, max_interval)
+            last_scores = scores
+
+            if timeout is not None:
+                interval = min(interval, max(timeout - elapsed, 0))
+            self.wait(interval)
+
+    def loadpicinfo(self, path, use_pack=True):
+        """
+        加载模板目录, 见 TemplateStore.load
+        模板总是加载到基准分辨率的 TemplateStore, 已切换分辨率时重新生成缩放后的模板
+        """
+        self.base_templates.load(path, use_pack)
+        if self.templates is not self.base_templates:
+            self.base_templates.scaled_stores.clear()
+            self.use_resolution(*self.resolution)
 
     def loadkeyinfo(self, path):
         key_pattern = re.compile(r"(\w+):\((\d+), (\d+)\),?")
@@ -124,6 +775,9 @@ if __name__ == "__main__":
     #Xij = 798 - 12i + 12j
     #Yij = 143 -10i -10j
     #i \in [0,22] j \in [0, 12]
+    # 逐格点击太慢时, 可以先截一次图找出像城墙的格子, 只点击候选格子:
+    # for cell in manager.scan_grid(gridscan.WALL_LATTICE, ["wall_tile"]):
+    #     manager.click(cell['x'], cell['y'])
 
     
     # def update_wall(manager, XY,lastxy_i, source="G"):
@@ -0,0 +1,154 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+
+class Metrics:
+    """
+    运行统计: 各阶段耗时 (计时器) 和事件计数 (计数器, 可带标签)
+    计时器保留最近 window 次的耗时用于计算分位数
+
+    metrics = Metrics()
+    with metrics.timer('grab'):
+        ...
+    metrics.count('picmath', template='home', result='hit')
+    """
+    def __init__(self, window=1024):
+        self.window = window
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start = time.monotonic()
+            self.timers = {}        # {name: {'count', 'total', 'max', 'samples'}}
+            self.counters = {}      # {(name, ((label, value), ...)): n}
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = self.timers[name] = {'count': 0, 'total': 0.0, 'max': 0.0,
+                                             'samples': deque(maxlen=self.window)}
+            timer['count'] += 1
+            timer['total'] += seconds
+            timer['max'] = max(timer['max'], seconds)
+            timer['samples'].append(seconds)
+
+    def count(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def snapshot(self):
+        """
+        返回当前统计的字典 (时间单位为秒)
+        """
+        with self.lock:
+            timers = {}
+            for name, timer in self.timers.items():
+                samples = np.array(timer['samples'])
+                timers[name] = {
+                    'count': timer['count'],
+                    'total': timer['total'],
+                    'mean': timer['total'] / timer['count'],
+                    'max': timer['max'],
+                    'p50': float(np.percentile(samples, 50)),
+                    'p95': float(np.percentile(samples, 95)),
+                }
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            return {'uptime': time.monotonic() - self.start, 'timers': timers, 'counters': counters}
+
+    def summary(self, top=6):
+        """
+        一行文字摘要: 等待/工作时间占比和耗时最多的几个阶段
+        """
+        data = self.snapshot()
+        uptime = data['uptime']
+        sleep = data['timers'].get('wait', {}).get('total', 0.0)
+        parts = [f"运行 {uptime:.0f}s, 等待 {sleep:.1f}s, 工作 {max(uptime - sleep, 0):.1f}s"]
+        busiest = sorted(((name, timer) for name, timer in data['timers'].items() if name != 'wait'),
+                         key=lambda item: item[1]['total'], reverse=True)[:top]
+        for name, timer in busiest:
+            parts.append(f"{name} {timer['count']}次 均{timer['mean'] * 1000:.1f}ms p95 {timer['p95'] * 1000:.1f}ms")
+        hits = sum(c['value'] for c in data['counters'] if c['name'] == 'picmath' and c['labels'].get('result') == 'hit')
+        misses = sum(c['value'] for c in data['counters'] if c['name'] == 'picmath' and c['labels'].get('result') == 'miss')
+        if hits or misses:
+            parts.append(f"picmath 命中 {hits} 未命中 {misses}")
+        stages = {}
+        for c in data['counters']:
+            if c['name'] == 'cascade':
+                stage = c['labels'].get('stage')
+                stages[stage] = stages.get(stage, 0) + c['value']
+        total = sum(stages.values())
+        if total:
+            parts.append('级联 ' + ' '.join(f"{stage} {stages.get(stage, 0) / total:.0%}"
+                                            for stage in ('reject', 'full')))
+        return ' | '.join(parts)
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+
+    def write_csv(self, path):
+        data = self.snapshot()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'name', 'labels', 'count', 'total', 'mean', 'max', 'p50', 'p95'])
+            for name, timer in sorted(data['timers'].items()):
+                writer.writerow(['timer', name, '', timer['count'], timer['total'], timer['mean'],
+                                 timer['max'], timer['p50'], timer['p95']])
+            for counter in data['counters']:
+                labels = ';'.join(f'{k}={v}' for k, v in counter['labels'].items())
+                writer.writerow(['counter', counter['name'], labels, counter['value'], '', '', '', '', ''])
+
+    def write_prometheus(self, path, prefix='hugan'):
+        """
+        写出 Prometheus 文本格式, 可由 node_exporter textfile collector 等本地采集器读取
+        先写临时文件再替换, 避免采集器读到写了一半的文件
+        """
+        data = self.snapshot()
+        lines = [f'# TYPE {prefix}_uptime_seconds gauge', f'{prefix}_uptime_seconds {data["uptime"]}',
+                 f'# TYPE {prefix}_stage_seconds summary']
+        for name, timer in sorted(data['timers'].items()):
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.5"}} {timer["p50"]}')
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.95"}} {timer["p95"]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {timer["total"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {timer["count"]}')
+        names = sorted({counter['name'] for counter in data['counters']})
+        for name in names:
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for counter in data['counters']:
+                if counter['name'] != name:
+                    continue
+                labels = ','.join(f'{k}="{v}"' for k, v in counter['labels'].items())
+                lines.append(f'{prefix}_{name}_total{{{labels}}} {counter["value"]}')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+    def write(self, path):
+        """
+        按扩展名选择格式: .json / .csv / 其他 (Prometheus 文本格式, 例如 .prom)
+        """
+        if path.endswith('.json'):
+            self.write_json(path)
+        elif path.endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_prometheus(path)
@@ -1,9 +1,14 @@
-import win32gui
-import win32api
-import win32con
 import time
 import random
 import ctypes
+from gesture import Gesture, play
+try:
+    import win32gui
+    import win32api
+    import win32con
+except ImportError:
+    # 非 Windows 环境 (例如用回放截图离线运行识别) 下无法连接模拟器
+    win32gui = win32api = win32con = None
 
 class MuMuController:
     def __init__(self):
@@ -11,6 +16,11 @@ class MuMuController:
         self.game_hwnd = None           # 游戏子窗口句柄
         self.client_rect = (0, 0, 0, 0) # 客户区坐标
         self.dpi_scale = 1.0           # DPI缩放因子
+        self.window_left = 0            # 游戏窗口左上角屏幕坐标
+        self.window_top = 0
+        self.metrics = None             # 可选的 metrics.Metrics, 记录 PostMessage 耗时
+        self.clock = time.monotonic     # 手势计划使用的时钟
+        self.sleep = time.sleep         # 按下和抬起之间以及手势各步之间的等待, 与 clock 配套
         
     def connect(self, window_title):
         """连接到MuMu模拟器窗口"""
@@ -73,78 +83,100 @@ class MuMuController:
         except:
             self.dpi_scale = 1.0
     
+    def client_origin(self):
+        """客户区左上角的屏幕坐标 (物理像素)"""
+        return win32gui.ClientToScreen(self.game_hwnd, (0, 0))
+    
     def _adjust_coords(self, x, y):
         """调整坐标考虑DPI缩放"""
         return int(x * self.dpi_scale), int(y * self.dpi_scale)
     
-    def click(self, x, y, button="left"):
-        """后台模拟点击(不移动物理鼠标)"""
-        if not self.game_hwnd:
-            print("未连接到游戏窗口")
-            return False
-        
-        # 调整DPI缩放后的坐标
+    def _mouse_lparam(self, x, y, check_range=True):
+        """调整DPI缩放后生成鼠标消息的LPARAM, 坐标超出客户区时返回None"""
         x, y = self._adjust_coords(x, y)
         
         # 确保坐标在客户区内
-        if not (0 <= x <= self.client_rect[2] and 0 <= y <= self.client_rect[3]):
+        if check_range and not (0 <= x <= self.client_rect[2] and 0 <= y <= self.client_rect[3]):
             print(f"坐标超出范围: ({x}, {y})")
-            return False
+            return None
         
         # 创建LPARAM (低16位=x, 高16位=y)
-        lparam = win32api.MAKELONG(x, y)
-        
-        # 根据按钮类型选择消息
+        return win32api.MAKELONG(x, y)
+
+    def _post(self, msg, wparam, lparam):
+        if self.metrics is None:
+            win32gui.PostMessage(self.game_hwnd, msg, wparam, lparam)
+            return
+        with self.metrics.timer('post_message'):
+            win32gui.PostMessage(self.game_hwnd, msg, wparam, lparam)
+
+    # 以下为不等待的基本输入操作, 供 click/press_key/swipe 和 InputQueue 组合使用
+    def mouse_down(self, x, y, button="left", check_range=True):
+        if not self.game_hwnd:
+            print("未连接到游戏窗口")
+            return False
+        lparam = self._mouse_lparam(x, y, check_range)
+        if lparam is None:
+            return False
         msg_down = win32con.WM_LBUTTONDOWN if button == "left" else win32con.WM_RBUTTONDOWN
+        key_state = win32con.MK_LBUTTON if button == "left" else win32con.MK_RBUTTON
+        self._post(msg_down, key_state, lparam)
+        return True
+
+    def mouse_up(self, x, y, button="left", check_range=True):
+        if not self.game_hwnd:
+            return False
+        lparam = self._mouse_lparam(x, y, check_range)
+        if lparam is None:
+            return False
         msg_up = win32con.WM_LBUTTONUP if button == "left" else win32con.WM_RBUTTONUP
+        self._post(msg_up, 0, lparam)
+        return True
+
+    def mouse_move(self, x, y, button="left"):
+        if not self.game_hwnd:
+            return False
         key_state = win32con.MK_LBUTTON if button == "left" else win32con.MK_RBUTTON
-        
-        # 发送鼠标消息
-        win32gui.PostMessage(self.game_hwnd, msg_down, key_state, lparam)
-        time.sleep(random.uniform(0.05, 0.15))
-        win32gui.PostMessage(self.game_hwnd, msg_up, 0, lparam)
+        self._post(win32con.WM_MOUSEMOVE, key_state, self._mouse_lparam(x, y, False))
         return True
-    
-    def press_key(self, vk_code, press_time=0.1):
-        """后台模拟按键(不干扰物理键盘)"""
+
+    def key_down(self, vk_code):
         if not self.game_hwnd:
             print("未连接到游戏窗口")
             return False
-        
-        # 发送按键消息
-        win32gui.PostMessage(self.game_hwnd, win32con.WM_KEYDOWN, vk_code, 0)
-        time.sleep(press_time)
-        win32gui.PostMessage(self.game_hwnd, win32con.WM_KEYUP, vk_code, 0)
+        self._post(win32con.WM_KEYDOWN, vk_code, 0)
         return True
+
+    def key_up(self, vk_code):
+        if not self.game_hwnd:
+            return False
+        self._post(win32con.WM_KEYUP, vk_code, 0)
+        return True
+
+    def click(self, x, y, button="left"):
+        """后台模拟点击(不移动物理鼠标)"""
+        if not self.mouse_down(x, y, button):
+            return False
+        self.sleep(random.uniform(0.05, 0.15))
+        return self.mouse_up(x, y, button)
+    
+    def press_key(self, vk_code, press_time=0.1):
+        """后台模拟按键(不干扰物理键盘)"""
+        if not self.key_down(vk_code):
+            return False
+        self.sleep(press_time)
+        return self.key_up(vk_code)
     
     def swipe(self, start_x, start_y, end_x, end_y, duration=0.5):
         """模拟滑动操作"""
         if not self.game_hwnd:
             return False
-            
-        start_x, start_y = self._adjust_coords(start_x, start_y)
-        end_x, end_y = self._adjust_coords(end_x, end_y)
-        
-        steps = int(duration * 10)
-        dx = (end_x - start_x) / steps
-        dy = (end_y - start_y) / steps
-        
-        # 发送鼠标按下
-        lparam = win32api.MAKELONG(start_x, start_y)
-        win32gui.PostMessage(self.game_hwnd, win32con.WM_LBUTTONDOWN, win32con.MK_LBUTTON, lparam)
-        
-        # 模拟移动
-        for i in range(steps):
-            x = int(start_x + dx * i)
-            y = int(start_y + dy * i)
-            lparam = win32api.MAKELONG(x, y)
-            win32gui.PostMessage(self.game_hwnd, win32con.WM_MOUSEMOVE, win32con.MK_LBUTTON, lparam)
-            time.sleep(duration/steps)
-        
-        # 发送鼠标释放
-        lparam = win32api.MAKELONG(end_x, end_y)
-        win32gui.PostMessage(self.game_hwnd, win32con.WM_LBUTTONUP, 0, lparam)
-        return True
+        gesture = Gesture().press(start_x, start_y).move_to(end_x, end_y, duration).release()
+        return self.play_gesture(gesture)['ok']
+
+    def play_gesture(self, gesture):
+        """按计划时间发送手势 (见 gesture.Gesture), 返回执行报告"""
+        return play(self, gesture, self.clock, self.sleep)
 
 if __name__ == "__main__":
     # 虚拟键码表 (MuMu模拟器常用)
@@ -1,36 +1,440 @@
+import time
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
 
-def compare_images(img1, img2, threshold1=100, threshold2=200):
+# SSIM 参数, 与 skimage.metrics.structural_similarity 默认值一致
+SSIM_WIN_SIZE = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_DATA_RANGE = 255
+
+# 批量比较时每次堆叠计算的最多模板数, 限制临时数组的大小以留在CPU缓存中
+BATCH_CHUNK = 16
+
+# 级联匹配粗判阶段: 灰度图缩小的倍数和缩小后的最小边长
+COARSE_SCALE = 4
+COARSE_MIN_SIZE = 8
+
+
+def _box_mean(img):
     """
-    比较两张图片的线条相似性
-    
+    SSIM 使用的均值滤波 (win_size x win_size 均匀窗口)
+    """
+    return cv2.blur(img, (SSIM_WIN_SIZE, SSIM_WIN_SIZE), borderType=cv2.BORDER_REFLECT)
+
+
+def prepare_template(img, threshold1=100, threshold2=200, gray=None, edges=None):
+    """
+    预处理模板图片, 模板不变时可以缓存结果重复使用
+
     参数:
-    image1_path: 第一张图片的路径
-    image2_path: 第二张图片的路径
+    img: RGB图片数组
     threshold1: Canny边缘检测低阈值
     threshold2: Canny边缘检测高阈值
-    
+    gray, edges: 已经算好的灰度图和边缘图 (例如从模板包读取), 可省略
+
+    返回:
+    特征字典 (原图, 灰度图, 边缘图, SSIM 所需的局部均值和方差, 粗判用的缩略向量)
+    其他相似度指标需要的模板数据在第一次使用时补充到字典中
+    """
+    if gray is None:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if edges is None:
+        edges = cv2.Canny(gray, threshold1, threshold2)
+
+    x = edges.astype(np.float64)
+    mu = _box_mean(x)
+    np_win = SSIM_WIN_SIZE ** 2
+    cov_norm = np_win / (np_win - 1)
+    var = cov_norm * (_box_mean(x * x) - mu * mu)
+    return {
+        'thresholds': (threshold1, threshold2),
+        'image': img,
+        'gray': gray,
+        'edges': edges,
+        'edges_f': x,
+        'mu': mu,
+        'var': var,
+        'coarse': _coarse_vector(cv2.resize(gray, _coarse_size(gray.shape), interpolation=cv2.INTER_AREA)),
+    }
+
+
+def compare_images_prepared(features, img2, metrics=None):
+    """
+    用预处理好的模板特征与新截图比较, 只需处理截图一侧
+
+    参数:
+    features: prepare_template 返回的模板特征
+    img2: 截图的RGB数组, 尺寸需与模板一致
+    metrics: 可选的 metrics.Metrics, 记录 canny 和 ssim 两个阶段的耗时
+
     返回:
     相似度分数 (0-1之间，1表示完全相同)
     """
-    
-    # 转换为灰度图
-    gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
+    threshold1, threshold2 = features['thresholds']
+    start = time.perf_counter()
     gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-    
-    # 使用Canny算法检测边缘
-    edges1 = cv2.Canny(gray1, threshold1, threshold2)
     edges2 = cv2.Canny(gray2, threshold1, threshold2)
+    edge_done = time.perf_counter()
+    score = _ssim_score(features, edges2.astype(np.float64))
+    if metrics is not None:
+        metrics.observe('canny', edge_done - start)
+        metrics.observe('ssim', time.perf_counter() - edge_done)
+    return score
+
+
+def _coarse_size(shape):
+    height, width = shape[:2]
+    return (min(width, max(width // COARSE_SCALE, COARSE_MIN_SIZE)),
+            min(height, max(height // COARSE_SCALE, COARSE_MIN_SIZE)))
+
+
+def _coarse_vector(thumb):
+    """
+    缩略灰度图去均值并归一化, 纯色图 (方差为0) 返回 None
+    """
+    thumb = thumb.astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    norm = float(np.linalg.norm(thumb))
+    if norm < 1e-3:
+        return None
+    return thumb / norm
+
+
+def coarse_score(features, img2):
+    """
+    级联匹配的粗判: 缩小后灰度图的归一化相关系数 (-1到1)
+
+    参数:
+    features: prepare_template 返回的模板特征
+    img2: 截图的RGB数组, 尺寸需与模板一致
+
+    返回:
+    相关系数, 模板或截图是纯色无法判断时返回 None
+    """
+    template = features['coarse']
+    if template is None:
+        return None
+    # 先缩小再转灰度, 只处理约 1/16 的像素
+    thumb = cv2.resize(img2, _coarse_size(img2.shape), interpolation=cv2.INTER_AREA)
+    vector = _coarse_vector(cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY))
+    if vector is None:
+        return None
+    return float(np.dot(template, vector))
+
+
+def _ssim_score(features, y):
+    """
+    计算平均 SSIM, 不生成完整的 SSIM 图 (结果与 skimage 的 mssim 相同)
+    """
+    np_win = SSIM_WIN_SIZE ** 2
+    cov_norm = np_win / (np_win - 1)
+    ux = features['mu']
+    vx = features['var']
+    uy = _box_mean(y)
+    vy = cov_norm * (_box_mean(y * y) - uy * uy)
+    vxy = cov_norm * (_box_mean(features['edges_f'] * y) - ux * uy)
+
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    crop = (slice(pad, -pad), slice(pad, -pad))
+    return float(_ssim_map(ux[crop], uy[crop], vx[crop], vy[crop], vxy[crop]).mean())
+
+
+def _ssim_map(ux, uy, vx, vy, vxy):
+    """
+    由局部统计量计算 SSIM
+    """
+    c1 = (SSIM_K1 * SSIM_DATA_RANGE) ** 2
+    c2 = (SSIM_K2 * SSIM_DATA_RANGE) ** 2
+    return ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+
+
+def _box_mean_valid(stack):
+    """
+    对 (N, h, w) 的图片组批量求窗口均值, 只返回窗口完全落在图内的区域
+    (即 SSIM 最终参与平均的区域)
+    把 N 张图竖直拼接后做一次均值滤波, 有效区域的窗口不会跨到相邻的图上
+    """
+    n, h, w = stack.shape
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    mean = _box_mean(stack.reshape(n * h, w)).reshape(n, h, w)
+    return mean[:, pad:-pad, pad:-pad]
+
+
+def prepare_batch(templates):
+    """
+    把多个模板按尺寸和Canny阈值分组并堆叠, 供 compare_batch 重复使用
+
+    参数:
+    templates: [(prepare_template 返回的特征, [x1, y1, x2, y2]), ...]
+
+    返回:
+    批量比较计划
+    """
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    crop = (slice(pad, -pad), slice(pad, -pad))
+    grouped = {}
+    for index, (features, roi) in enumerate(templates):
+        key = (features['edges'].shape, features['thresholds'])
+        grouped.setdefault(key, []).append((index, features, roi))
+
+    groups = []
+    for (shape, thresholds), items in grouped.items():
+        groups.append({
+            'thresholds': thresholds,
+            'indices': np.array([index for index, _, _ in items]),
+            'rois': [roi for _, _, roi in items],
+            # 批量计算使用 float32, 与逐个比较的分数相差不到 1e-4
+            'x': np.stack([features['edges_f'] for _, features, _ in items]).astype(np.float32),
+            'mu': np.stack([features['mu'][crop] for _, features, _ in items]).astype(np.float32),
+            'var': np.stack([features['var'][crop] for _, features, _ in items]).astype(np.float32),
+        })
+    return {'count': len(templates), 'groups': groups}
+
+
+def compare_batch(frame, plan, metrics=None, executor=None, chunk_size=4, origin=(0, 0), guard=None):
+    """
+    在一幅截图上一次计算多个模板的相似度, 同尺寸的模板一起做均值滤波
+
+    参数:
+    frame: 截图的RGB数组, 需要包含所有模板的区域
+    plan: prepare_batch 返回的批量比较计划
+    metrics: 可选的 metrics.Metrics, 记录 canny 和 ssim 两个阶段的耗时
+    executor: 可选的线程池 (concurrent.futures.Executor), 指定时每组按 chunk_size 个模板
+              切块并行计算 (cv2 的 Canny/blur 会释放 GIL)
+    chunk_size: 并行时每块的模板数
+    origin: frame 左上角的客户区坐标, frame 只截取了客户区的一部分时使用
+    guard: 并行时每块计算期间进入的上下文管理器 (例如限制同时识别线程数的 Semaphore), 可省略
+
+    返回:
+    相似度分数数组, 顺序与 prepare_batch 传入的模板一致
+    """
+    scores = np.empty(plan['count'])
+    if executor is None:
+        # 每组按 BATCH_CHUNK 个模板分块计算, 模板很多时整组堆叠的数组太大反而更慢
+        for group in plan['groups']:
+            for start in range(0, len(group['rois']), BATCH_CHUNK):
+                _score_rows(frame, group, slice(start, start + BATCH_CHUNK), scores, metrics, origin)
+        return scores
+
+    def score_chunk(group, rows):
+        if guard is None:
+            _score_rows(frame, group, rows, scores, metrics, origin)
+            return
+        with guard:
+            _score_rows(frame, group, rows, scores, metrics, origin)
+
+    # 每块写入 scores 中互不重叠的位置, 结果与串行计算完全相同
+    futures = [
+        executor.submit(score_chunk, group, slice(start, start + chunk_size))
+        for group in plan['groups']
+        for start in range(0, len(group['rois']), chunk_size)
+    ]
+    for future in futures:
+        future.result()
+    return scores
+
+
+def _score_rows(frame, group, rows, scores, metrics=None, origin=(0, 0)):
+    """
+    计算一组模板中 rows 切片范围内的分数, 写入 scores
+    """
+    np_win = SSIM_WIN_SIZE ** 2
+    cov_norm = np_win / (np_win - 1)
+    threshold1, threshold2 = group['thresholds']
+    ox, oy = origin
+    start = time.perf_counter()
+    y = np.stack([
+        cv2.Canny(cv2.cvtColor(np.ascontiguousarray(frame[y1 - oy:y2 - oy, x1 - ox:x2 - ox]), cv2.COLOR_BGR2GRAY),
+                  threshold1, threshold2)
+        for x1, y1, x2, y2 in group['rois'][rows]
+    ]).astype(np.float32)
+    edge_done = time.perf_counter()
+    ux = group['mu'][rows]
+    uy = _box_mean_valid(y)
+    vy = cov_norm * (_box_mean_valid(y * y) - uy * uy)
+    vxy = cov_norm * (_box_mean_valid(group['x'][rows] * y) - ux * uy)
+    s = _ssim_map(ux, uy, group['var'][rows], vy, vxy)
+    scores[group['indices'][rows]] = s.mean(axis=(1, 2))
+    if metrics is not None:
+        metrics.observe('canny', edge_done - start)
+        metrics.observe('ssim', time.perf_counter() - edge_done)
+
+
+def roi_fingerprint(img, size=16):
+    """
+    计算截图区域的缩略指纹, 用于廉价地判断画面是否变化
+    """
+    height, width = img.shape[:2]
+    thumb = cv2.resize(img, (min(size, width), min(size, height)), interpolation=cv2.INTER_AREA)
+    return thumb.astype(np.int16)
+
+
+def roi_unchanged(fingerprint1, fingerprint2, tolerance=2):
+    """
+    两个指纹的最大像素差不超过 tolerance 时认为区域没有变化
+    """
+    if fingerprint1 is None or fingerprint1.shape != fingerprint2.shape:
+        return False
+    return int(np.abs(fingerprint1 - fingerprint2).max()) <= tolerance
+
+
+def find_template(region_gray, template_gray, max_levels=3, min_size=8, margin=4):
+    """
+    在搜索区域内用图像金字塔由粗到细查找模板位置
+
+    参数:
+    region_gray: 搜索区域的灰度图
+    template_gray: 模板灰度图
+    max_levels: 最多缩小的层数 (每层缩小一半)
+    min_size: 缩小后模板的最小边长
+    margin: 细化时在上一层结果附近搜索的像素范围
+
+    返回:
+    ((x, y) 模板左上角在搜索区域内的坐标, 归一化相关系数分数)
+    """
+    th, tw = template_gray.shape[:2]
+    rh, rw = region_gray.shape[:2]
+    if th > rh or tw > rw:
+        return None, 0.0
+
+    regions = [region_gray]
+    templates = [template_gray]
+    while (len(templates) <= max_levels
+           and min(templates[-1].shape[:2]) // 2 >= min_size):
+        regions.append(cv2.pyrDown(regions[-1]))
+        templates.append(cv2.pyrDown(templates[-1]))
+
+    # 最粗的一层做全区域匹配
+    result = np.nan_to_num(cv2.matchTemplate(regions[-1], templates[-1], cv2.TM_CCOEFF_NORMED))
+    _, score, _, (x, y) = cv2.minMaxLoc(result)
+
+    # 逐层放大, 只在上一层结果附近搜索
+    for level in range(len(templates) - 2, -1, -1):
+        region, template = regions[level], templates[level]
+        th, tw = template.shape[:2]
+        rh, rw = region.shape[:2]
+        x0 = min(max(x * 2 - margin, 0), rw - tw)
+        y0 = min(max(y * 2 - margin, 0), rh - th)
+        x1 = min(x * 2 + margin + tw, rw)
+        y1 = min(y * 2 + margin + th, rh)
+        result = np.nan_to_num(cv2.matchTemplate(region[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED))
+        _, score, _, (x, y) = cv2.minMaxLoc(result)
+        x, y = x + x0, y + y0
+    return (x, y), float(score)
+
+
+def edge_iou(features, img2, metrics=None):
+    """
+    边缘图的重合度 (交集/并集), 两边都没有边缘时为1
+    """
+    threshold1, threshold2 = features['thresholds']
+    start = time.perf_counter()
+    edges2 = cv2.Canny(cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY), threshold1, threshold2)
+    edge_done = time.perf_counter()
+    edges1 = features['edges']
+    union = np.count_nonzero(edges1 | edges2)
+    score = np.count_nonzero(edges1 & edges2) / union if union else 1.0
+    if metrics is not None:
+        metrics.observe('canny', edge_done - start)
+        metrics.observe('edge_iou', time.perf_counter() - edge_done)
+    return float(score)
+
+
+def ncc(features, img2, metrics=None):
+    """
+    灰度图的归一化相关系数 (小于0的按0计), 任意一边是纯色时为0
+    """
+    start = time.perf_counter()
+    gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    result = np.nan_to_num(cv2.matchTemplate(gray2, features['gray'], cv2.TM_CCOEFF_NORMED))
+    if metrics is not None:
+        metrics.observe('ncc', time.perf_counter() - start)
+    return max(float(result[0, 0]), 0.0)
+
+
+def _color_hist(img):
+    hist = cv2.calcHist([img], [0, 1, 2], None, [8, 8, 8], [0, 256, 0, 256, 0, 256])
+    return cv2.normalize(hist, hist).ravel()
+
+
+def color_hist(features, img2, metrics=None):
+    """
+    颜色直方图 (每通道8级) 的相关系数, 适合纯色按钮和资源图标, 对位置偏移不敏感
+    """
+    start = time.perf_counter()
+    if 'hist' not in features:
+        features['hist'] = _color_hist(features['image'])
+    score = cv2.compareHist(features['hist'], _color_hist(img2), cv2.HISTCMP_CORREL)
+    if metrics is not None:
+        metrics.observe('color_hist', time.perf_counter() - start)
+    return max(float(score), 0.0)
+
+
+def _phash(gray):
+    """
+    64位感知哈希: 32x32 缩略图 DCT 的低频 8x8 系数与中位数比较
+    """
+    dct = cv2.dct(cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32))[:8, :8]
+    return dct > np.median(dct.ravel()[1:])
+
+
+def phash(features, img2, metrics=None):
+    """
+    感知哈希相似度: 1 - 汉明距离/64
+    """
+    start = time.perf_counter()
+    if 'phash' not in features:
+        features['phash'] = _phash(features['gray'])
+    distance = np.count_nonzero(features['phash'] != _phash(cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)))
+    if metrics is not None:
+        metrics.observe('phash', time.perf_counter() - start)
+    return float(1.0 - distance / 64)
+
+
+# 相似度指标: {名称: func(模板特征, 截图, metrics=None) -> 分数}, 分数越大越相似
+SIMILARITY_METRICS = {
+    'edge_ssim': compare_images_prepared,
+    'edge_iou': edge_iou,
+    'ncc': ncc,
+    'color_hist': color_hist,
+    'phash': phash,
+}
+
+
+def similarity(features, img2, metric='edge_ssim', metrics=None):
+    """
+    用指定的相似度指标比较预处理好的模板和截图
+
+    参数:
+    features: prepare_template 返回的模板特征
+    img2: 截图的RGB数组, 尺寸需与模板一致
+    metric: SIMILARITY_METRICS 中的指标名
+    metrics: 可选的 metrics.Metrics, 记录各阶段耗时
+    """
+    try:
+        func = SIMILARITY_METRICS[metric]
+    except KeyError:
+        raise ValueError(f'未知的相似度指标: {metric}') from None
+    return func(features, img2, metrics)
+
+
+def compare_images(img1, img2, threshold1=100, threshold2=200, metric='edge_ssim'):
+    """
+    比较两张图片的线条相似性
     
-    # 计算结构相似性指数 (SSIM)
-    score, _ = ssim(edges1, edges2, full=True)
+    参数:
+    img1: 第一张图片的RGB数组
+    img2: 第二张图片的RGB数组
+    threshold1: Canny边缘检测低阈值
+    threshold2: Canny边缘检测高阈值
+    metric: 相似度指标, 见 SIMILARITY_METRICS
     
-    # 也可以使用其他比较方法，如计算重合度
-    # intersection = np.logical_and(edges1, edges2)
-    # union = np.logical_or(edges1, edges2)
-    # iou_score = np.sum(intersection) / np.sum(union)
+    返回:
+    相似度分数 (0-1之间，1表示完全相同)
+    """
+    # 默认计算边缘图的结构相似性指数 (SSIM)
+    score = similarity(prepare_template(img1, threshold1, threshold2), img2, metric)
     #visualize_comparison(img1, img2, threshold1, threshold2)
     return score
 
@@ -0,0 +1,244 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from capture import CaptureBackend
+
+
+class ReplayFinished(Exception):
+    """
+    回放的录制画面已经全部用完
+    """
+
+
+class SessionRecorder:
+    """
+    录制一次运行过程: 每次截图保存为 frames/xxxxxx.png, 截图和输入操作按时间顺序
+    写入 events.jsonl, 每行一个事件, t 为相对录制开始的秒数
+    图片压缩和写盘在后台线程进行, 不阻塞识别
+    """
+    def __init__(self, path, clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+        self.start = clock()
+        self.frame_count = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(path, 'frames'), exist_ok=True)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'start_time': time.time()}, f)
+        self.events_file = open(os.path.join(path, 'events.jsonl'), 'w', encoding='utf-8')
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def record_frame(self, region, frame):
+        with self.lock:
+            file = f'frames/{self.frame_count:06d}.png'
+            self.frame_count += 1
+            event = {'t': self.clock() - self.start, 'type': 'grab', 'region': list(region), 'file': file}
+            self.queue.put((event, frame))
+
+    def record_input(self, kind, **kwargs):
+        with self.lock:
+            event = {'t': self.clock() - self.start, 'type': kind}
+            event.update(kwargs)
+            self.queue.put((event, None))
+
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            event, frame = item
+            if frame is not None:
+                cv2.imwrite(os.path.join(self.path, event['file']), cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            self.events_file.write(json.dumps(event) + '\n')
+            self.events_file.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.events_file.close()
+
+
+class RecordingCapture(CaptureBackend):
+    """
+    包装另一个截图后端, 把每次截到的画面交给 SessionRecorder
+    """
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def client_size(self):
+        return self.inner.client_size()
+
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        frame = self.inner.grab(x_top, y_top, x_bottom, y_bottom)
+        self.recorder.record_frame((x_top, y_top, x_bottom, y_bottom), frame)
+        return frame
+
+
+class VirtualClock:
+    """
+    回放用的虚拟时钟, sleep 只推进时间不真正等待
+    """
+    def __init__(self):
+        self.t = 0.0
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        self.t += max(seconds, 0)
+
+    def advance_to(self, t):
+        self.t = max(self.t, t)
+
+
+def load_events(path):
+    with open(os.path.join(path, 'events.jsonl'), 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class SessionReplayCapture(CaptureBackend):
+    """
+    按录制时间回放 SessionRecorder 录下的画面
+
+    录下的截图按区域贴到一张与客户区同样大的画布上, 截图时返回画布上
+    当前时刻的内容, 所以识别方式改变 (例如整屏快照代替单独截图) 后也能回放
+
+    realtime=False: 全速回放, 使用虚拟时钟, 每次截图至少前进到下一次录制的截图,
+                    Manager.wait 只推进虚拟时间, 结果完全可复现
+    realtime=True:  按录制时的真实时间回放
+    """
+    def __init__(self, path, realtime=False):
+        self.path = path
+        events = load_events(path)
+        self.grabs = [event for event in events if event['type'] == 'grab']
+        self.inputs = [event for event in events if event['type'] != 'grab']
+        if not self.grabs:
+            raise ValueError(f"录制中没有截图: {path}")
+        width = max(event['region'][2] for event in self.grabs)
+        height = max(event['region'][3] for event in self.grabs)
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.position = 0
+
+        if realtime:
+            self.virtual = None
+            start = time.monotonic()
+            self.clock = lambda: time.monotonic() - start
+            self.sleep = time.sleep
+        else:
+            self.virtual = VirtualClock()
+            self.clock = self.virtual.now
+            self.sleep = self.virtual.sleep
+
+    def client_size(self):
+        return self.canvas.shape[1], self.canvas.shape[0]
+
+    def grab(self, x_top, y_top, x_bottom, y_bottom):
+        if self.position >= len(self.grabs):
+            raise ReplayFinished()
+        if self.virtual is not None:
+            self.virtual.advance_to(self.grabs[self.position]['t'])
+
+        now = self.clock()
+        while self.position < len(self.grabs) and self.grabs[self.position]['t'] <= now:
+            event = self.grabs[self.position]
+            x1, y1, x2, y2 = event['region']
+            bgr = cv2.imread(os.path.join(self.path, event['file']), cv2.IMREAD_COLOR)
+            self.canvas[y1:y2, x1:x2] = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            self.position += 1
+        return self.canvas[y_top:y_bottom, x_top:x_bottom].copy()
+
+
+class ReplayController:
+    """
+    回放时代替 MuMuController, 只记录输入操作不真正发送
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.simulator_hwnd = None
+        self.game_hwnd = None
+        self.client_rect = (0, 0, 0, 0)
+        self.dpi_scale = 1.0
+        self.window_left = 0
+        self.window_top = 0
+        self.inputs = []
+
+    def connect(self, window_title):
+        return True
+
+    def click(self, x, y, button="left"):
+        self.inputs.append({'t': self.clock(), 'type': 'click', 'x': x, 'y': y, 'button': button})
+        return True
+
+    # InputQueue 使用的基本操作
+    def mouse_down(self, x, y, button="left", check_range=True):
+        self.inputs.append({'t': self.clock(), 'type': 'mouse_down', 'x': x, 'y': y, 'button': button})
+        return True
+
+    def mouse_up(self, x, y, button="left", check_range=True):
+        self.inputs.append({'t': self.clock(), 'type': 'mouse_up', 'x': x, 'y': y, 'button': button})
+        return True
+
+    def mouse_move(self, x, y, button="left"):
+        self.inputs.append({'t': self.clock(), 'type': 'mouse_move', 'x': x, 'y': y})
+        return True
+
+    def key_down(self, vk_code):
+        self.inputs.append({'t': self.clock(), 'type': 'key_down', 'vk_code': vk_code})
+        return True
+
+    def key_up(self, vk_code):
+        self.inputs.append({'t': self.clock(), 'type': 'key_up', 'vk_code': vk_code})
+        return True
+
+    def press_key(self, vk_code, press_time=0.1):
+        self.inputs.append({'t': self.clock(), 'type': 'press_key', 'vk_code': vk_code})
+        return True
+
+    def swipe(self, start_x, start_y, end_x, end_y, duration=0.5):
+        self.inputs.append({'t': self.clock(), 'type': 'swipe', 'start_x': start_x, 'start_y': start_y,
+                            'end_x': end_x, 'end_y': end_y, 'duration': duration})
+        return True
+
+    def play_gesture(self, gesture):
+        planned, coalesced = gesture.plan()
+        self.inputs.append({'t': self.clock(), 'type': 'gesture', 'events': planned})
+        return {'ok': True, 'intended': planned[-1][0] if planned else 0.0, 'actual': 0.0,
+                'posted': len(planned), 'coalesced': coalesced, 'late_mean': 0.0, 'late_max': 0.0}
+
+
+def replay_session(path, func, realtime=False, max_runs=None):
+    """
+    用录制的画面离线运行任务函数, 直到画面用完
+
+    参数:
+    path: SessionRecorder 录制的目录
+    func: 任务函数, 参数为 Manager
+    realtime: 是否按录制时的真实时间回放
+    max_runs: 最多运行任务函数的次数, None 表示直到画面用完
+
+    返回:
+    运行结束后的 Manager, manager.win_controller.inputs 为任务发出的输入操作
+    """
+    from mannager import Manager
+
+    capture = SessionReplayCapture(path, realtime)
+    manager = Manager(capture=capture, controller=ReplayController(capture.clock))
+    manager.clock = capture.clock
+    manager.sleep = capture.sleep
+    manager.win_controller.client_rect = (0, 0) + capture.client_size()
+    manager.has_connected = True
+    runs = 0
+    try:
+        while max_runs is None or runs < max_runs:
+            func(manager)
+            runs += 1
+    except ReplayFinished:
+        pass
+    return manager
@@ -0,0 +1,227 @@
+"""
+多任务协作调度: 几个任务轮流使用同一个 Manager (同一个模拟器窗口)
+
+每个任务在自己的线程中运行, 但同一时刻只有持有控制权的任务在执行;
+任务调用 manager.wait 等待较长时间 (>= min_yield 秒, 例如等训练/等战斗结束) 时让出控制权,
+其他可运行的任务按优先级接手, 等待结束后原任务重新排队取回控制权
+不希望被打断的步骤可以放在 with manager.exclusive(): 中
+
+任务文件中定义 SCHEDULE 即可由界面加载:
+SCHEDULE = [
+    {'task': collect, 'priority': 2, 'interval': 600},
+    {'task': attack, 'priority': 1, 'window': ('08:00', '23:30')},
+    {'task': upgrade_wall, 'name': 'wall', 'times': 3},
+]
+
+task: 任务函数 (参数为 Manager); name: 名称, 默认为函数名
+priority: 优先级, 越大越先获得控制权; window: 每天允许运行的时间段, 可以跨午夜
+interval: 两次开始运行的最小间隔 (秒); times: 最多运行次数
+"""
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from mannager import TaskCancelled
+
+
+def _parse_time(value):
+    if isinstance(value, datetime.time):
+        return value
+    hour, minute = value.split(':')
+    return datetime.time(int(hour), int(minute))
+
+
+class ScheduledTask:
+    def __init__(self, task, name=None, priority=0, window=None, interval=0, times=None):
+        self.func = task
+        self.name = name or getattr(task, '__name__', 'task')
+        self.priority = priority
+        self.window = (_parse_time(window[0]), _parse_time(window[1])) if window else None
+        self.interval = interval
+        self.times = times
+        self.runs = 0
+        self.errors = 0
+        self.yields = 0
+        self.last_start = None
+        self.exclusive = 0          # > 0 时等待不让出控制权
+        self.status = '等待'
+
+    def in_window(self, now=None):
+        if self.window is None:
+            return True
+        now = (now or datetime.datetime.now()).time()
+        start, end = self.window
+        if start <= end:
+            return start <= now < end
+        return now >= start or now < end
+
+    def delay(self, clock, times=None):
+        """
+        距离可以再次运行还要等待的秒数, 已达到运行次数上限时返回 None
+        """
+        limit = times if self.times is None else (self.times if times is None else min(self.times, times))
+        if limit is not None and self.runs >= limit:
+            return None
+        if not self.in_window():
+            return 1.0
+        if self.last_start is not None and self.interval:
+            return max(self.last_start + self.interval - clock(), 0.0)
+        return 0.0
+
+
+class Scheduler:
+    """
+    协作式多任务调度, 可以像普通任务函数一样调用: scheduler(manager) 把每个任务各运行一次
+    """
+    def __init__(self, spec, min_yield=0.5, clock=time.monotonic):
+        self.spec = spec
+        self.tasks = [ScheduledTask(**entry) for entry in spec]
+        self.min_yield = min_yield  # 等待时间不短于此值时让出控制权
+        self.clock = clock
+        self.log = None             # 可选的日志函数, 参数为字符串
+        self.__name__ = 'scheduler'
+        self.cond = threading.Condition()
+        self.owner = None           # 持有控制权的任务
+        self.queue = {}             # {等待控制权的任务: 排队序号}
+        self.sequence = 0
+        self.local = threading.local()
+        self.manager = None
+        self.stop_event = None
+
+    def __call__(self, manager):
+        self.run(manager, times=1)
+
+    def _log(self, msg):
+        if self.log is not None:
+            self.log(msg)
+
+    def current(self):
+        """
+        当前线程正在运行的任务, 不是调度线程时返回 None
+        """
+        return getattr(self.local, 'task', None)
+
+    def acquire(self, task):
+        """
+        排队等待控制权: 优先级高的先得, 同优先级按排队顺序; 停止时返回 False
+        """
+        with self.cond:
+            self.sequence += 1
+            self.queue[task] = self.sequence
+            try:
+                while True:
+                    if self.stop_event.is_set():
+                        return False
+                    best = max(self.queue, key=lambda t: (t.priority, -self.queue[t]))
+                    if self.owner is None and best is task:
+                        self.owner = task
+                        return True
+                    self.cond.wait(0.5)
+            finally:
+                del self.queue[task]
+                self.cond.notify_all()
+
+    def release(self, task):
+        with self.cond:
+            if self.owner is task:
+                self.owner = None
+                self.cond.notify_all()
+
+    def should_yield(self, seconds):
+        task = self.current()
+        return task is not None and self.owner is task and not task.exclusive and seconds >= self.min_yield
+
+    @contextmanager
+    def yielding(self):
+        """
+        Manager.wait 使用: 等待期间把控制权交给其他任务, 结束后重新取回
+        """
+        task = self.current()
+        task.yields += 1
+        task.status = '等待中'
+        self.release(task)
+        try:
+            yield
+        finally:
+            self.acquire(task)
+            task.status = '运行中'
+
+    @contextmanager
+    def exclusive(self):
+        task = self.current()
+        if task is None:
+            yield
+            return
+        task.exclusive += 1
+        try:
+            yield
+        finally:
+            task.exclusive -= 1
+
+    def run(self, manager, stop_event=None, times=None, duration=None):
+        """
+        运行所有任务, 直到每个任务都达到运行次数, 超过 duration 秒, 或 stop_event 被设置
+
+        参数:
+        times: 每个任务最多运行的次数 (任务自己的 times 更小时以任务为准), None 表示不限
+        duration: 最长运行秒数, 到时后等正在运行的任务结束本轮
+        """
+        self.manager = manager
+        self.stop_event = stop_event or manager.stop_event or threading.Event()
+        deadline = None if duration is None else self.clock() + duration
+        saved = (manager.scheduler, manager.stop_event)
+        manager.scheduler = self
+        manager.stop_event = self.stop_event
+        errors = []
+
+        def worker(task):
+            self.local.task = task
+            while not self.stop_event.is_set() and (deadline is None or self.clock() < deadline):
+                delay = task.delay(self.clock, times)
+                if delay is None:
+                    break
+                if delay > 0:
+                    if deadline is not None:
+                        delay = min(delay, max(deadline - self.clock(), 0))
+                    self.stop_event.wait(min(delay, 1.0))
+                    continue
+                if not self.acquire(task):
+                    break
+                try:
+                    if task.delay(self.clock, times) != 0.0:
+                        continue
+                    task.last_start = self.clock()
+                    task.status = '运行中'
+                    self._log(f'Scheduler: {task.name} started')
+                    task.func(manager)
+                    task.runs += 1
+                    manager.metrics.count('scheduler_run', task=task.name, result='ok')
+                    self._log(f'Scheduler: {task.name} iteration {task.runs} finished')
+                except TaskCancelled as e:
+                    errors.append(e)
+                    break
+                except Exception as e:
+                    task.errors += 1
+                    task.runs += 1
+                    manager.metrics.count('scheduler_run', task=task.name, result='error')
+                    self._log(f'Scheduler: {task.name} error: {e}')
+                finally:
+                    task.status = '等待'
+                    self.release(task)
+            task.status = '结束'
+
+        threads = [threading.Thread(target=worker, args=(task,), name=f'task-{task.name}', daemon=True)
+                   for task in self.tasks]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            manager.scheduler, manager.stop_event = saved
+        if errors:
+            raise errors[0]
+
+    def status(self):
+        return [{'name': task.name, 'status': task.status, 'runs': task.runs, 'errors': task.errors,
+                 'yields': task.yields, 'priority': task.priority} for task in self.tasks]
@@ -0,0 +1,124 @@
+"""
+声明式状态机任务
+
+任务由若干状态组成, 每个状态列出要识别的模板和对应的转移:
+画面上出现某个模板时执行它的动作并进入下一个状态, to 为 null 时本轮任务结束
+同一状态的所有候选模板通过 Manager.wait_any 在同一张截图上一起识别
+
+{
+    "initial": "home",
+    "states": {
+        "home": {
+            "transitions": [
+                {"when": "gold", "actions": [["press", "G"], ["wait", 0.5]], "to": "home"},
+                {"when": "ready", "threshold": 0.85, "actions": [["press", "X", 3]], "to": "battle"}
+            ],
+            "timeout": 30,
+            "on_timeout": {"actions": [["press", "D"]], "to": "home"}
+        },
+        "battle": {
+            "transitions": [{"when": "hui", "actions": [["press", "V"]], "to": null}]
+        }
+    }
+}
+
+动作为 [Manager 方法名, 参数...], 可用的方法见 ACTIONS; 在 Python 中定义时也可以直接写函数, 参数为 Manager
+"""
+import json
+
+# 允许在动作中调用的 Manager 方法
+ACTIONS = ('click', 'press', 'swipe', 'gesture', 'wait', 'wait_until', 'wait_any', 'wait_input')
+
+
+class StateMachineError(Exception):
+    pass
+
+
+class StateMachine:
+    """
+    状态机任务, 可以像普通任务函数一样调用: machine(manager) 从初始状态运行到结束
+    """
+    def __init__(self, spec, threshold=None):
+        self.spec = spec
+        self.initial = spec['initial']
+        self.states = spec['states']
+        # 转移没有写 threshold 时使用的阈值, None 表示使用模板自己设置的阈值 (TemplateStore.set_metric)
+        self.threshold = spec.get('threshold', threshold)
+        self.max_steps = spec.get('max_steps')
+        self.log = None             # 可选的日志函数, 参数为字符串
+        self.history = []           # 最近一轮的 (状态, 匹配的模板, 识别耗时)
+        self.__name__ = spec.get('name', 'state_machine')
+        self._validate()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        spec.setdefault('name', path)
+        return cls(spec)
+
+    def _validate(self):
+        if self.initial not in self.states:
+            raise StateMachineError(f"初始状态 {self.initial} 不存在")
+        for name, state in self.states.items():
+            transitions = list(state.get('transitions', []))
+            if 'on_timeout' in state:
+                transitions.append(state['on_timeout'])
+            if not state.get('transitions') and 'on_timeout' not in state:
+                raise StateMachineError(f"状态 {name} 没有任何转移")
+            for transition in transitions:
+                target = transition.get('to')
+                if target is not None and target not in self.states:
+                    raise StateMachineError(f"状态 {name} 转移到不存在的状态 {target}")
+                for action in transition.get('actions', []):
+                    if not callable(action) and action[0] not in ACTIONS:
+                        raise StateMachineError(f"状态 {name} 中有不支持的动作 {action[0]}")
+
+    def _emit(self, msg):
+        if self.log is not None:
+            self.log(msg)
+
+    def run_actions(self, manager, actions):
+        for action in actions:
+            if callable(action):
+                action(manager)
+            else:
+                getattr(manager, action[0])(*action[1:])
+
+    def step(self, manager, state_name):
+        """
+        在一个状态上等待任一候选模板出现并执行转移, 返回下一个状态名 (None 表示结束)
+        """
+        state = self.states[state_name]
+        transitions = state.get('transitions', [])
+        names = list(dict.fromkeys(transition['when'] for transition in transitions))
+        thresholds = {}
+        for transition in transitions:
+            thresholds.setdefault(transition['when'], transition.get('threshold', self.threshold))
+
+        if names:
+            matched, elapsed = manager.wait_any(names, timeout=state.get('timeout'), threshold=thresholds)
+        else:
+            matched, elapsed = None, 0.0
+        self.history.append((state_name, matched, elapsed))
+
+        if matched is None:
+            transition = state.get('on_timeout')
+            if transition is None:
+                raise StateMachineError(f"状态 {state_name} 等待超时")
+            self._emit(f"[{state_name}] 超时 {elapsed:.1f}s -> {transition.get('to')}")
+        else:
+            transition = next(t for t in transitions if t['when'] == matched)
+            self._emit(f"[{state_name}] {matched} ({elapsed:.2f}s) -> {transition.get('to')}")
+        self.run_actions(manager, transition.get('actions', []))
+        return transition.get('to')
+
+    def __call__(self, manager):
+        self.history = []
+        state_name = self.initial
+        steps = 0
+        while state_name is not None:
+            if self.max_steps is not None and steps >= self.max_steps:
+                raise StateMachineError(f"超过最大步数 {self.max_steps}")
+            state_name = self.step(manager, state_name)
+            steps += 1
@@ -0,0 +1,208 @@
+"""
+模板清单: 用 JSON 文件记录模板的坐标, 相似度指标, 阈值, 分组和搜索区域,
+代替把坐标编码在文件名里 (name_x1_y1_x2_y2.png)
+
+pictures/manifest.json:
+{
+    "version": 1,
+    "resolution": [1600, 900],
+    "dpi_scale": 1.0,
+    "templates": [
+        {"name": "home", "file": "home_1533_485_1605_833.png", "roi": [1533, 485, 1605, 833],
+         "group": "main", "metric": "edge_ssim", "threshold": 0.8},
+        {"name": "gold", "file": "icons/gold.png", "roi": [20, 20, 60, 60],
+         "group": "main", "metric": "color_hist", "threshold": 0.9, "search_region": [0, 0, 400, 200]}
+    ]
+}
+
+file 为相对模板目录的路径; group, metric, threshold, search_region 可省略
+resolution 为截取模板时的客户区大小, 窗口大小不同时按比例缩放模板 (见 templatescale), 省略时不缩放
+dpi_scale 为截取模板和记录 key_xy 坐标时窗口的 DPI 缩放比例, 省略时为 1.0
+没有清单文件时按文件名导入, 可以用 python templatemanifest.py pictures [宽x高] 生成初始清单
+"""
+import json
+import os
+import re
+import sys
+
+MANIFEST_NAME = 'manifest.json'
+NAME_PATTERN = re.compile(r'(\w+)_(\d+)_(\d+)_(\d+)_(\d+).png')
+REGION_CELL = 256   # 区域索引的网格边长 (像素)
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def manifest_path_for(path):
+    return os.path.join(path, MANIFEST_NAME)
+
+
+def import_pictures(path):
+    """
+    按文件名规则 name_x1_y1_x2_y2.png 遍历模板目录生成清单, 同名模板只保留第一个,
+    其余记录在清单的 skipped 中; 子目录名作为分组
+    """
+    templates = []
+    skipped = []
+    names = set()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            math_obj = NAME_PATTERN.match(file)
+            if not math_obj:
+                continue
+            name = math_obj.group(1)
+            relpath = os.path.relpath(os.path.join(root, file), path).replace(os.sep, '/')
+            if name in names:
+                print(f"图片 {name} 已存在，跳过加载: {relpath}")
+                skipped.append(relpath)
+                continue
+            names.add(name)
+            entry = {'name': name, 'file': relpath, 'roi': [int(math_obj.group(i)) for i in range(2, 6)]}
+            if '/' in relpath:
+                entry['group'] = relpath.split('/', 1)[0]
+            templates.append(entry)
+    return {'version': 1, 'templates': templates, 'skipped': skipped}
+
+
+def load_manifest(path):
+    """
+    读取并检查清单文件, 模板名重复, 缺少字段或坐标不合法时抛出 ManifestError
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    names = set()
+    for entry in manifest.get('templates', []):
+        for field in ('name', 'file', 'roi'):
+            if field not in entry:
+                raise ManifestError(f"{path}: 模板缺少 {field}: {entry}")
+        name = entry['name']
+        if name in names:
+            raise ManifestError(f"{path}: 模板名重复: {name}")
+        names.add(name)
+        for field in ('roi', 'search_region'):
+            rect = entry.get(field)
+            if rect is not None and (len(rect) != 4 or rect[0] >= rect[2] or rect[1] >= rect[3]):
+                raise ManifestError(f"{path}: 模板 {name} 的 {field} 不合法: {rect}")
+    return manifest
+
+
+def save_manifest(manifest, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def template_entries(path):
+    """
+    模板目录的全部模板: 清单中的模板, 加上清单里没有的、按文件名规则命名的图片
+    (例如新截取的模板), 没有清单时全部按文件名导入
+    """
+    imported = import_pictures(path)['templates']
+    manifest_file = manifest_path_for(path)
+    if not os.path.exists(manifest_file):
+        return imported
+    entries = load_manifest(manifest_file)['templates']
+    files = {entry['file'] for entry in entries}
+    names = {entry['name'] for entry in entries}
+    entries = entries + [entry for entry in imported if entry['file'] not in files and entry['name'] not in names]
+    return entries
+
+
+def manifest_resolution(path):
+    """
+    模板目录清单中记录的基准分辨率 (宽, 高), 没有清单或没有记录时返回 None
+    """
+    manifest_file = manifest_path_for(path)
+    if not os.path.exists(manifest_file):
+        return None
+    resolution = load_manifest(manifest_file).get('resolution')
+    return tuple(resolution) if resolution else None
+
+
+def manifest_dpi_scale(path):
+    """
+    模板目录清单中记录的基准 DPI 缩放比例, 没有清单或没有记录时返回 1.0
+    """
+    manifest_file = manifest_path_for(path)
+    if not os.path.exists(manifest_file):
+        return 1.0
+    return float(load_manifest(manifest_file).get('dpi_scale', 1.0))
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class TemplateRegistry:
+    """
+    模板元数据的内存索引: 按模板名, 分组和屏幕区域查询
+    """
+    def __init__(self, entries=()):
+        self.entries = {}       # {name: 清单条目}
+        self.order = {}         # {name: 加载序号}
+        self.groups = {}        # {group: [name, ...]}
+        self.cells = {}         # {(列, 行): {name, ...}}, 区域索引
+        for entry in entries:
+            self.add(entry)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _cells(self, rect):
+        x1, y1, x2, y2 = rect
+        for cx in range(x1 // REGION_CELL, (x2 - 1) // REGION_CELL + 1):
+            for cy in range(y1 // REGION_CELL, (y2 - 1) // REGION_CELL + 1):
+                yield cx, cy
+
+    def add(self, entry):
+        name = entry['name']
+        if name in self.entries:
+            raise ManifestError(f"模板名重复: {name}")
+        self.entries[name] = entry
+        self.order[name] = len(self.order)
+        self.groups.setdefault(entry.get('group'), []).append(name)
+        for cell in self._cells(entry['roi']):
+            self.cells.setdefault(cell, set()).add(name)
+
+    def get(self, name):
+        return self.entries[name]
+
+    def names(self):
+        return list(self.entries)
+
+    def group(self, group):
+        """
+        分组内的模板名 (按加载顺序)
+        """
+        return list(self.groups.get(group, []))
+
+    def in_region(self, rect, group=None):
+        """
+        坐标与 rect 相交的模板名 (按加载顺序), 可以再限定分组
+        """
+        found = set()
+        for cell in self._cells(rect):
+            found.update(self.cells.get(cell, ()))
+        return [name for name in sorted(found, key=self.order.get)
+                if _intersects(self.entries[name]['roi'], rect)
+                and (group is None or self.entries[name].get('group') == group)]
+
+
+if __name__ == '__main__':
+    # 根据现有文件名生成清单: python templatemanifest.py [模板目录] [截图时的分辨率, 如 1600x900]
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'pictures'
+    target = manifest_path_for(directory)
+    if os.path.exists(target):
+        print(f"{target} 已存在")
+        sys.exit(1)
+    manifest = import_pictures(directory)
+    if len(sys.argv) > 2:
+        manifest['resolution'] = [int(v) for v in sys.argv[2].lower().split('x')]
+    save_manifest(manifest, target)
+    print(f"已导入 {len(manifest['templates'])} 个模板到 {target}, 跳过 {len(manifest['skipped'])} 个重名文件")
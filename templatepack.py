@@ -0,0 +1,189 @@
+"""
+模板包: 把 pictures 目录下的模板预处理后写入单个文件, 通过 mmap 按需读取
+
+文件格式:
+8 字节 MAGIC + 8 字节索引长度 + JSON 索引, 之后按 ALIGN 对齐的数据区
+每个模板在数据区中依次保存 RGB 原图, 灰度图和按位压缩的 Canny 边缘图,
+索引记录模板名, 坐标, 源文件的 mtime/size 以及各数据块的偏移
+"""
+import json
+import mmap
+import os
+import struct
+import cv2
+import numpy as np
+from PIL import Image
+from templatemanifest import template_entries
+
+MAGIC = b'HGPACK01'
+ALIGN = 64
+
+
+def pack_path_for(path):
+    """
+    模板目录对应的模板包路径 (与目录同级, 例如 pictures -> pictures.pack)
+    """
+    return os.path.normpath(path) + '.pack'
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class TemplatePack:
+    """
+    以只读 mmap 打开的模板包, 模板数据在第一次访问时才从文件读入内存
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.mm[:8] != MAGIC:
+                raise ValueError(f"不是模板包文件: {path}")
+            index_len, = struct.unpack('<Q', self.mm[8:16])
+            self.index = json.loads(self.mm[16:16 + index_len].decode('utf-8'))
+        except Exception:
+            self.close()
+            raise
+        self.data_offset = _align(16 + index_len)
+        self.thresholds = tuple(self.index['thresholds'])
+        self.entries = {entry['name']: entry for entry in self.index['templates']}
+
+    def close(self):
+        if getattr(self, 'mm', None) is not None:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+
+    def names(self):
+        return [entry['name'] for entry in self.index['templates']]
+
+    def roi(self, name):
+        return list(self.entries[name]['roi'])
+
+    def _view(self, name, block):
+        offset, length = self.entries[name][block]
+        return np.frombuffer(self.mm, dtype=np.uint8, count=length, offset=self.data_offset + offset)
+
+    def rgb(self, name):
+        height, width = self.entries[name]['shape']
+        return self._view(name, 'rgb').reshape(height, width, 3)
+
+    def gray(self, name):
+        height, width = self.entries[name]['shape']
+        return self._view(name, 'gray').reshape(height, width)
+
+    def edges(self, name):
+        """
+        按 self.thresholds 计算的 Canny 边缘图 (0/255)
+        """
+        height, width = self.entries[name]['shape']
+        bits = np.unpackbits(self._view(name, 'edges'), count=height * width)
+        return (bits * 255).reshape(height, width)
+
+    def block_bytes(self, name, block):
+        return self._view(name, block).tobytes()
+
+
+def _scan(path, entries=None):
+    """
+    为模板条目 (见 templatemanifest.template_entries) 补充源文件的 mtime 和大小
+    """
+    if entries is None:
+        entries = template_entries(path)
+    found = []
+    for entry in entries:
+        stat = os.stat(os.path.join(path, entry['file']))
+        found.append({
+            'name': entry['name'],
+            'file': entry['file'],
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'roi': list(entry['roi']),
+        })
+    return found
+
+
+def _encode(file_path, threshold1, threshold2):
+    rgb = np.ascontiguousarray(np.array(Image.open(file_path).convert('RGB')))
+    gray = cv2.cvtColor(rgb, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, threshold1, threshold2)
+    return rgb.shape[:2], {
+        'rgb': rgb.tobytes(),
+        'gray': gray.tobytes(),
+        'edges': np.packbits(edges > 0).tobytes(),
+    }
+
+
+def load_pack(path, pack_path=None, threshold1=100, threshold2=200, entries=None):
+    """
+    打开模板目录对应的模板包, 只重新解码 mtime 或大小变化了的图片,
+    没有任何变化时直接使用已有的包
+
+    参数:
+    path: 模板目录
+    pack_path: 模板包路径, 默认见 pack_path_for
+    threshold1, threshold2: 预先计算边缘图使用的Canny阈值
+    entries: 要打包的模板条目, 默认为 templatemanifest.template_entries(path)
+
+    返回:
+    TemplatePack
+    """
+    pack_path = pack_path or pack_path_for(path)
+    old = None
+    if os.path.exists(pack_path):
+        try:
+            old = TemplatePack(pack_path)
+        except (ValueError, OSError, struct.error):
+            old = None
+
+    found = _scan(path, entries)
+    reusable = {}
+    if old is not None and old.thresholds == (threshold1, threshold2):
+        for entry in old.index['templates']:
+            reusable[entry['file']] = entry
+    unchanged = old is not None and len(found) == len(old.entries) and all(
+        entry['file'] in reusable
+        and reusable[entry['file']]['name'] == entry['name']
+        and reusable[entry['file']]['mtime'] == entry['mtime']
+        and reusable[entry['file']]['size'] == entry['size']
+        for entry in found
+    )
+    if unchanged:
+        return old
+
+    # 重新生成: 未变化的模板直接复制旧包中的数据
+    blobs = []
+    offset = 0
+    for entry in found:
+        cached = reusable.get(entry['file'])
+        if cached and cached['mtime'] == entry['mtime'] and cached['size'] == entry['size']:
+            shape = cached['shape']
+            blocks = {block: old.block_bytes(cached['name'], block) for block in ('rgb', 'gray', 'edges')}
+        else:
+            shape, blocks = _encode(os.path.join(path, entry['file']), threshold1, threshold2)
+        entry['shape'] = list(shape)
+        for block in ('rgb', 'gray', 'edges'):
+            entry[block] = [offset, len(blocks[block])]
+            blobs.append((offset, blocks[block]))
+            offset = _align(offset + len(blocks[block]))
+
+    index = json.dumps({'version': 1, 'thresholds': [threshold1, threshold2], 'templates': found}).encode('utf-8')
+    data_offset = _align(16 + len(index))
+    tmp_path = pack_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(index)) + index)
+        for blob_offset, blob in blobs:
+            f.seek(data_offset + blob_offset)
+            f.write(blob)
+        f.truncate(data_offset + offset)
+    if old is not None:
+        # Windows 下文件仍被映射时无法替换
+        old.close()
+    try:
+        os.replace(tmp_path, pack_path)
+    except PermissionError:
+        # 旧包仍被其他进程映射, 本次直接使用新生成的临时文件
+        return TemplatePack(tmp_path)
+    return TemplatePack(pack_path)
@@ -0,0 +1,80 @@
+"""
+按客户区分辨率缩放模板: 模板在基准分辨率 (清单中的 resolution) 下截取,
+窗口大小改变后按比例缩放模板图片和坐标, 结果保存在模板目录旁的缓存目录中
+
+pictures.scaled/1280x720/   缩放后的图片 (相对路径与原模板相同) 和 index.json
+pictures.scaled/1280x720.pack   由 templatepack.load_pack 生成的模板包
+"""
+import json
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+INDEX_NAME = 'index.json'
+
+
+def scaled_dir_for(path, size):
+    width, height = size
+    return os.path.join(os.path.normpath(path) + '.scaled', f'{width}x{height}')
+
+
+def scale_rect(rect, scale_x, scale_y):
+    x1, y1, x2, y2 = rect
+    x1, y1 = int(round(x1 * scale_x)), int(round(y1 * scale_y))
+    return [x1, y1, max(int(round(x2 * scale_x)), x1 + 1), max(int(round(y2 * scale_y)), y1 + 1)]
+
+
+def scale_templates(path, entries, images, base, size):
+    """
+    缩放一个模板目录的模板, 源图片和目标尺寸都没有变化的模板直接使用上次的结果
+
+    参数:
+    path: 模板目录
+    entries: 模板条目 (见 templatemanifest.template_entries)
+    images: {模板名: RGB数组}, 基准分辨率下的模板图片
+    base: 基准分辨率 (宽, 高)
+    size: 目标分辨率 (宽, 高)
+
+    返回:
+    (缓存目录, 缩放后的模板条目)
+    """
+    scale_x, scale_y = size[0] / base[0], size[1] / base[1]
+    directory = scaled_dir_for(path, size)
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX_NAME)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    scaled = []
+    changed = False
+    for entry in entries:
+        entry = dict(entry)
+        stat = os.stat(os.path.join(path, entry['file']))
+        entry['roi'] = scale_rect(entry['roi'], scale_x, scale_y)
+        if entry.get('search_region') is not None:
+            entry['search_region'] = scale_rect(entry['search_region'], scale_x, scale_y)
+        x1, y1, x2, y2 = entry['roi']
+        key = [stat.st_mtime_ns, stat.st_size, x2 - x1, y2 - y1]
+        target = os.path.join(directory, entry['file'])
+        if index.get(entry['file']) != key or not os.path.exists(target):
+            image = images[entry['name']]
+            # 缩小用 INTER_AREA 避免摩尔纹, 放大用双线性
+            shrink = x2 - x1 < image.shape[1] or y2 - y1 < image.shape[0]
+            resized = cv2.resize(np.ascontiguousarray(image), (x2 - x1, y2 - y1),
+                                 interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            Image.fromarray(resized).save(target)
+            index[entry['file']] = key
+            changed = True
+        scaled.append(entry)
+
+    if changed:
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    return directory, scaled
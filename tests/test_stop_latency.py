@@ -0,0 +1,30 @@
+"""
+停止延迟: 任务处于长等待, 轮询识别和连续输入时, 设置 stop_event 后应在 STOP_LATENCY_LIMIT 内退出
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import STOP_LATENCY_LIMIT, STOP_TASKS, bench_workspace, stop_latency, synthetic_frame
+from capture import ReplayCapture
+from mannager import Manager
+from recorder import ReplayController
+
+
+class StopLatencyTest(unittest.TestCase):
+    DELAYS = (0.02, 0.05, 0.1)
+
+    def test_stop_latency(self):
+        with bench_workspace(synthetic_frame(), 2):
+            for name, task in STOP_TASKS.items():
+                manager = Manager(capture=ReplayCapture('frames'), controller=ReplayController())
+                for delay in self.DELAYS:
+                    with self.subTest(task=name, delay=delay):
+                        latency = stop_latency(manager, task, delay)
+                        self.assertLess(latency, STOP_LATENCY_LIMIT)
+
+
+if __name__ == '__main__':
+    unittest.main()